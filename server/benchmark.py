@@ -0,0 +1,309 @@
+"""
+Offline benchmark suite for the PayZoll agent server.
+
+Everything runs on local stand-ins, so no OpenAI, Twitter, Reddit or RPC traffic
+leaves the machine:
+  - a stub OpenAI server that answers with scripted function calls after a
+    configurable latency,
+  - fake Twitter/Reddit endpoints for the cross-posting engine,
+  - an in-process EVM (web3's EthereumTesterProvider) for bulk transfers.
+
+It measures /api requests/sec and p50/p99 latency under concurrency, and bulk
+transfer tx/s for a range of roster sizes. Results are written as JSON so runs can
+be compared between commits:
+
+    pip install "web3[tester]"
+    python benchmark.py --output bench_results.json
+    python benchmark.py --baseline bench_results.json --output new_results.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Function calls the stub model cycles through; None means a plain text answer
+SCRIPTED_CALLS = [
+    ("get_payzoll_faq", {}),
+    ("employee_analytics", {}),
+    ("random_quote", {}),
+    ("calculate_payroll_savings", {"traditional_cost": 10000, "employee_count": 25}),
+    ("get_company_details", {}),
+    ("cross_post", {"body": "PayZoll benchmark post", "subreddits": ["payzoll_bench"]}),
+    (None, None),
+]
+
+# ----------------------
+# Local stand-in servers
+# ----------------------
+def start_server(handler_class):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def stub_openai_handler(latency_ms):
+    """
+    Builds a handler for /v1/chat/completions that replays SCRIPTED_CALLS in order.
+    """
+    script = itertools.cycle(SCRIPTED_CALLS)
+    script_lock = threading.Lock()
+
+    class StubOpenAI(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("content-length", 0))
+            request_body = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(latency_ms / 1000)
+
+            with script_lock:
+                name, arguments = next(script)
+            if name and request_body.get("functions"):
+                message = {"role": "assistant", "content": None,
+                           "function_call": {"name": name, "arguments": json.dumps(arguments)}}
+                finish_reason = "function_call"
+            else:
+                message = {"role": "assistant", "content": "PayZoll makes payroll fast and borderless."}
+                finish_reason = "stop"
+
+            prompt_tokens = sum(len(str(m.get("content") or "")) for m in request_body.get("messages", [])) // 4
+            body = json.dumps({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request_body.get("model", "gpt-4o"),
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 12, "total_tokens": prompt_tokens + 12}
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return StubOpenAI
+
+class FakeSocial(BaseHTTPRequestHandler):
+    """
+    Minimal Twitter v2 and Reddit OAuth endpoints used by the cross-posting engine.
+    """
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length", 0))
+        self.rfile.read(length)
+        if self.path == "/2/tweets":
+            status, payload = 201, {"data": {"id": str(time.time_ns())}}
+            headers = {"x-rate-limit-remaining": "1000", "x-rate-limit-reset": str(int(time.time()) + 900)}
+        elif self.path == "/api/v1/access_token":
+            status, payload, headers = 200, {"access_token": "bench", "expires_in": 3600}, {}
+        elif self.path == "/api/submit":
+            status, payload = 200, {"json": {"errors": [], "data": {"id": str(time.time_ns())}}}
+            headers = {"x-ratelimit-remaining": "1000", "x-ratelimit-reset": "60"}
+        else:
+            status, payload, headers = 404, {}, {}
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+# ----------------------
+# Measurements
+# ----------------------
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def bench_api(agent, total_requests, concurrency):
+    """
+    Fires total_requests /api calls from `concurrency` client threads against a
+    threaded werkzeug server and reports throughput and latency percentiles.
+    """
+    import requests
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, agent.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api"
+    messages = ["Show me the FAQ", "Employee analytics please", "Give me a quote",
+                "How much would 25 employees save?", "List employees", "Post our launch", "What is PayZoll?"]
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            # A distinct client per worker, so per-client admission limits don't throttle the run
+            headers = {"X-Client-Id": f"bench-{threading.current_thread().name}"}
+            response = requests.post(url, json={"message": messages[i % len(messages)]}, headers=headers, timeout=60)
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total_requests)))
+    wall = time.perf_counter() - started
+    server.shutdown()
+
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_seconds": round(wall, 4),
+        "requests_per_second": round(total_requests / wall, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+def bench_transfers(agent, sizes):
+    """
+    Streams synthetic rosters of each size through the bulk transfer pipeline on an
+    in-process EVM and reports transactions per second.
+    """
+    from eth_account import Account
+    from web3 import EthereumTesterProvider, Web3
+
+    results = []
+    for size in sizes:
+        w3 = Web3(EthereumTesterProvider())
+        sender = Account.create()
+        w3.eth.send_transaction({"from": w3.eth.accounts[0], "to": sender.address, "value": w3.to_wei(size + 10, "ether")})
+        recipients = [Account.create().address for _ in range(min(size, 1000))]
+        roster = ({"id": i, "accountId": recipients[i % len(recipients)], "salary": "0.001"} for i in range(size))
+        log_path = os.path.join(agent.DATA_DIR, f"bench_transfer_{size}.csv")
+
+        started = time.perf_counter()
+        result = agent.stream_bulk_transfer(w3, sender.key, roster, log_path)
+        wall = time.perf_counter() - started
+        results.append({
+            "employees": size,
+            "status": result["status"],
+            "succeeded": result["summary"]["succeeded"],
+            "wall_seconds": round(wall, 4),
+            "tx_per_second": round(result["summary"]["sent"] / wall, 2) if wall else None,
+        })
+        print(f"  {size:>6} employees: {results[-1]['tx_per_second']} tx/s")
+    return results
+
+def compare(baseline, current):
+    """
+    Prints the relative change of the headline numbers against a previous run.
+    """
+    def change(old, new):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    if baseline.get("api") and current.get("api"):
+        for key in ("requests_per_second", "p50_ms", "p99_ms"):
+            print(f"api {key}: {baseline['api'][key]} -> {current['api'][key]} ({change(baseline['api'][key], current['api'][key])})")
+    old_transfers = {r["employees"]: r for r in baseline.get("transfers", [])}
+    for row in current.get("transfers", []):
+        old = old_transfers.get(row["employees"])
+        if old:
+            print(f"transfers {row['employees']}: {old['tx_per_second']} -> {row['tx_per_second']} tx/s "
+                  f"({change(old['tx_per_second'], row['tx_per_second'])})")
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=SERVER_DIR, capture_output=True, text=True).stdout.strip() or None
+    except Exception:
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline PayZoll server benchmarks")
+    parser.add_argument("--requests", type=int, default=200, help="Number of /api requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent /api clients")
+    parser.add_argument("--openai-latency-ms", type=float, default=50, help="Simulated model latency")
+    parser.add_argument("--transfer-sizes", default="10,1000,10000", help="Comma-separated roster sizes")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--skip-transfers", action="store_true")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    args = parser.parse_args(argv)
+    output_path = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    _, openai_url = start_server(stub_openai_handler(args.openai_latency_ms))
+    _, social_url = start_server(FakeSocial)
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-bench",
+        "TWITTER_API_BASE_URL": social_url,
+        "REDDIT_API_BASE_URL": social_url,
+        "REDDIT_AUTH_BASE_URL": social_url,
+        # The load generator stands in for a proxy, so its X-Client-Id headers count
+        "ADMISSION_TRUSTED_PROXIES": "127.0.0.1",
+    })
+
+    # Work on a scratch copy of data/ so benchmarks never touch real logs or history
+    workdir = tempfile.mkdtemp(prefix="payzoll-bench-")
+    shutil.copytree(os.path.join(SERVER_DIR, "data"), os.path.join(workdir, "data"))
+    with open(os.path.join(workdir, "data", "chat_history.json"), "w") as f:
+        json.dump([], f)
+    os.chdir(workdir)
+    sys.path.insert(0, SERVER_DIR)
+    import web_agent_4o as agent
+    agent.openai.api_base = f"{openai_url}/v1"
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "openai_latency_ms": args.openai_latency_ms,
+        },
+    }
+    try:
+        if not args.skip_api:
+            print(f"Benchmarking /api: {args.requests} requests, concurrency {args.concurrency}")
+            results["api"] = bench_api(agent, args.requests, args.concurrency)
+            print(f"  {results['api']['requests_per_second']} req/s, p50 {results['api']['p50_ms']} ms, p99 {results['api']['p99_ms']} ms")
+        if not args.skip_transfers:
+            print("Benchmarking bulk transfers")
+            sizes = [int(size) for size in args.transfer_sizes.split(",") if size.strip()]
+            results["transfers"] = bench_transfers(agent, sizes)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output_path}")
+    if baseline_path:
+        with open(baseline_path) as f:
+            compare(json.load(f), results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,216 @@
 import os
+import sys
 import csv
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
 
 # Define the data directory
 DATA_DIR = "data"
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
-
-# Create the company employees CSV with dummy data
-company_employees_path = os.path.join(DATA_DIR, "company_employees.csv")
-with open(company_employees_path, mode="w", newline="") as file:
-    writer = csv.writer(file)
-    # Write header row: columns should include name, address, salary, work_hours, etc.
-    writer.writerow(["name", "address", "salary", "work_hours"])
-    # Write some dummy employee rows
-    writer.writerow(["Alice", "123 Main St", 0.8, 40])
-    writer.writerow(["Bob", "456 Elm St", 0.5, 35])
-    writer.writerow(["Charlie", "789 Oak St", 0.6, 38])
-
-# Create an initial bulk transfer log CSV with just the header row
-bulk_transfer_log_path = os.path.join(DATA_DIR, "bulk_transfer_log.csv")
-with open(bulk_transfer_log_path, mode="w", newline="") as file:
-    writer = csv.writer(file)
-    writer.writerow(["tx_hash", "status", "recipient", "amount", "timestamp"])
-
-print("Initial CSV files created successfully.")
+COMPANIES_DIR = "All_Companies"
+
+
+def write_initial_files(data_dir=DATA_DIR):
+    """
+    Writes the starter employee CSV and an empty bulk transfer log.
+    """
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+
+    # Create the company employees CSV with dummy data
+    company_employees_path = os.path.join(data_dir, "company_employees.csv")
+    with open(company_employees_path, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        # Write header row: columns should include name, address, salary, work_hours, etc.
+        writer.writerow(["name", "address", "salary", "work_hours"])
+        # Write some dummy employee rows
+        writer.writerow(["Alice", "123 Main St", 0.8, 40])
+        writer.writerow(["Bob", "456 Elm St", 0.5, 35])
+        writer.writerow(["Charlie", "789 Oak St", 0.6, 38])
+
+    # Create an initial bulk transfer log CSV with just the header row
+    bulk_transfer_log_path = os.path.join(data_dir, "bulk_transfer_log.csv")
+    with open(bulk_transfer_log_path, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["tx_hash", "status", "recipient", "amount", "timestamp"])
+
+    print("Initial CSV files created successfully.")
+
+
+# ----------------------
+# Synthetic data for load testing
+# ----------------------
+# Generates N companies x M employees x K historical payments in the All_Companies
+# layout, the first company's roster in the data/ layout, and optionally a transfer
+# log of any size. Every company gets its own RNG derived from the seed, so output
+# is reproducible and doesn't depend on generation order.
+FIRST_NAMES = ["Aarav", "Ananya", "Vihaan", "Diya", "Arjun", "Isha", "Kabir", "Meera", "Rohan", "Saanvi",
+               "Liam", "Olivia", "Noah", "Emma", "Lucas", "Mia", "Ethan", "Sofia", "Mateo", "Chloe"]
+LAST_NAMES = ["Sharma", "Gupta", "Patel", "Reddy", "Iyer", "Khan", "Singh", "Mehta", "Nair", "Das",
+              "Smith", "Garcia", "Kim", "Nguyen", "Silva", "Müller", "Rossi", "Dubois", "Tanaka", "Cohen"]
+DEPARTMENTS = {
+    "Management": ["CEO", "COO", "Director"],
+    "Engineering": ["Software Engineer", "Senior Engineer", "Engineering Manager", "DevOps Engineer"],
+    "Marketing": ["Marketing Manager", "Content Strategist", "Growth Analyst"],
+    "Finance": ["Accountant", "Financial Analyst", "Controller"],
+    "Operations": ["Operations Manager", "Support Specialist", "HR Generalist"],
+}
+PAYMENT_TYPES = ["regular"] * 8 + ["bonus", "reimbursement"]
+TRANSFER_LOG_FIELDS = ["tx_hash", "status", "recipient", "amount", "timestamp", "nonce", "replaces"]
+WRITE_CHUNK_ROWS = 10000
+
+
+def _wallet(rng):
+    return "0x%040x" % rng.getrandbits(160)
+
+
+def _company_rng(seed, company_index):
+    return random.Random(f"{seed}:{company_index}")
+
+
+def generate_employees(rng, count):
+    """
+    Yields synthetic employees with a wallet, department, salary (ether) and status.
+    """
+    departments = list(DEPARTMENTS)
+    for i in range(1, count + 1):
+        department = departments[rng.randrange(len(departments))]
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield {
+            "id": i,
+            "employee_id": f"user_{i:06d}",
+            "name": f"{first} {last}",
+            "email": f"{first.lower()}.{last.lower()}{i}@example.com",
+            "department": department,
+            "position": rng.choice(DEPARTMENTS[department]),
+            "salary": round(rng.uniform(0.005, 0.05), 7),
+            "work_hours": rng.randint(30, 45),
+            "status": "active" if rng.random() < 0.9 else "inactive",
+            "wallet": _wallet(rng),
+        }
+
+
+def _payment_history(rng, salary, count, end_date):
+    """
+    One row per past payment, newest first, roughly a month apart.
+    """
+    for k in range(count):
+        date = end_date - timedelta(days=30 * k + rng.randint(0, 3))
+        kind = rng.choice(PAYMENT_TYPES)
+        amount = salary if kind == "regular" else salary * rng.uniform(0.1, 0.5)
+        yield (f"{amount:.7f}", date.strftime("%Y-%m-%d"), kind,
+               f"{rng.uniform(0.004, 0.007):.7f}", round(rng.uniform(1.5, 3.0), 2))
+
+
+def generate_company(root, seed, company_index, employees, payments, end_date):
+    """
+    Writes one company in the All_Companies layout and returns its employees.
+    """
+    rng = _company_rng(seed, company_index)
+    name = f"Synthetic_{company_index:04d}"
+    company_dir = os.path.join(root, COMPANIES_DIR, name)
+    os.makedirs(company_dir, exist_ok=True)
+
+    roster = list(generate_employees(rng, employees))
+    with open(os.path.join(company_dir, f"{name}.csv"), mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["employee_id", "current_status", "wallet_address", "department"])
+        writer.writerows((emp["employee_id"], emp["status"], emp["wallet"], emp["department"]) for emp in roster)
+
+    if payments:
+        for emp in roster:
+            with open(os.path.join(company_dir, f"{emp['employee_id']}.csv"), mode="w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(["amount", "date", "type", "gas_cost", "time_of_transaction"])
+                writer.writerows(_payment_history(rng, emp["salary"], payments, end_date))
+    return roster
+
+
+def write_data_roster(data_dir, roster):
+    """
+    Writes a roster in the data/company_employees.csv layout.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, "company_employees.csv"), mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["id", "name", "email", "department", "position", "salary", "work_hours", "accountId"])
+        writer.writerows((emp["id"], emp["name"], emp["email"], emp["department"], emp["position"],
+                          emp["salary"], emp["work_hours"], emp["wallet"]) for emp in roster)
+
+
+def write_transfer_log(data_dir, seed, roster, rows, end_date):
+    """
+    Writes a transfer log of `rows` transactions to the roster over the past year,
+    mostly successful with a few failed and stuck ones, in chunks.
+    """
+    rng = random.Random(f"{seed}:log")
+    os.makedirs(data_dir, exist_ok=True)
+    start = end_date - timedelta(days=365)
+    step = (end_date - start).total_seconds() / max(rows, 1)
+    wallets = [emp["wallet"] for emp in roster]
+    salaries = [int(emp["salary"] * 10 ** 18) for emp in roster]
+    with open(os.path.join(data_dir, "bulk_transfer_log.csv"), mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(TRANSFER_LOG_FIELDS)
+        for chunk_start in range(0, rows, WRITE_CHUNK_ROWS):
+            chunk = []
+            for i in range(chunk_start, min(rows, chunk_start + WRITE_CHUNK_ROWS)):
+                who = i % len(wallets)
+                roll = rng.random()
+                status = 1 if roll < 0.985 else (0 if roll < 0.995 else "stuck")
+                timestamp = (start + timedelta(seconds=i * step)).strftime("%Y-%m-%d %H:%M:%S")
+                chunk.append(("0x%064x" % rng.getrandbits(256), status, wallets[who], salaries[who], timestamp, i, ""))
+            writer.writerows(chunk)
+
+
+def generate(root=".", companies=1, employees=100, payments=12, transfer_log_rows=0, seed=0, data_dir=None):
+    """
+    Generates the synthetic dataset and returns counts of what was written.
+    """
+    started = time.perf_counter()
+    end_date = datetime(2025, 3, 1)
+    data_dir = data_dir or os.path.join(root, DATA_DIR)
+    first_roster = None
+    for company_index in range(1, companies + 1):
+        roster = generate_company(root, seed, company_index, employees, payments, end_date)
+        if first_roster is None:
+            first_roster = roster
+    if first_roster:
+        write_data_roster(data_dir, first_roster)
+        if transfer_log_rows:
+            write_transfer_log(data_dir, seed, first_roster, transfer_log_rows, end_date)
+    return {
+        "companies": companies,
+        "employees": companies * employees,
+        "payments": companies * employees * payments,
+        "transfer_log_rows": transfer_log_rows if first_roster else 0,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Create the starter CSV files, or with --companies a synthetic dataset for load testing")
+    parser.add_argument("--companies", type=int, help="Number of synthetic companies (All_Companies/Synthetic_NNNN)")
+    parser.add_argument("--employees", type=int, default=100, help="Employees per company")
+    parser.add_argument("--payments", type=int, default=12, help="Historical payments per employee")
+    parser.add_argument("--transfer-log-rows", type=int, default=0, help="Rows in data/bulk_transfer_log.csv")
+    parser.add_argument("--seed", type=int, default=0, help="Seed; the same seed gives the same files")
+    parser.add_argument("--root", default=".", help="Directory to write All_Companies/ and data/ into")
+    parser.add_argument("--data-dir", help="Where to write the data/ layout (default <root>/data)")
+    args = parser.parse_args(argv)
+
+    if args.companies is None:
+        write_initial_files(args.data_dir or os.path.join(args.root, DATA_DIR))
+        return 0
+    counts = generate(args.root, args.companies, args.employees, args.payments,
+                      args.transfer_log_rows, args.seed, args.data_dir)
+    print(f"Generated {counts['companies']} companies, {counts['employees']} employees, "
+          f"{counts['payments']} payments and {counts['transfer_log_rows']} transfer log rows "
+          f"in {counts['seconds']}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,38 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 import openai
 import json
 import os
-import tweepy
-import praw
-from web3 import Web3
+import sys
+import argparse
+import subprocess
 from dotenv import load_dotenv
 import csv
 from datetime import datetime
 import re
 from flask_cors import CORS
 import random
+import queue
+import collections
+import functools
+import decimal
+import gzip
+import hashlib
+import hmac
+import io
+import math
+import threading
+import time
+import heapq
+import uuid
+import urllib.parse
+import requests
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: nonce state is only shared between threads
+    fcntl = None
 
 # Load environment variables from .env file
 load_dotenv()
@@ -24,26 +46,386 @@ CORS(app)  # This will enable CORS for all routes by default
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
 # ----------------------
-# Twitter API configuration using Tweepy
+# Metrics (Prometheus exposition format)
 # ----------------------
-twitter_client = tweepy.Client(
-    bearer_token=os.getenv("BEARER_KEY"),
-    consumer_key=os.getenv("CONSUMER_KEY"),
-    consumer_secret=os.getenv("CONSUMER_SECRET"),
-    access_token=os.getenv("ACCESS_KEY"),
-    access_token_secret=os.getenv("ACCESS_SECRET")
-)
+# Stage timings, counters and histograms for the agent pipeline and bulk transfers.
+# Everything is exported on GET /metrics; the stage timings of the current request
+# are also collected per thread so /api can return them in a "timings" block.
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Metrics:
+    """
+    Thread-safe registry of counters, gauges and histograms keyed by name and labels.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def inc(self, name, labels=None, value=1):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, labels=None):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, labels=None):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(METRIC_BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(METRIC_BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    @staticmethod
+    def _labels(labels, extra=None):
+        pairs = list(labels) + (list(extra) if extra else [])
+        if not pairs:
+            return ""
+        escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs]
+        return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: dict(h, buckets=list(h["buckets"])) for key, h in self.histograms.items()}
+
+        lines = []
+        described = set()
+
+        def header(name, default_kind):
+            if name in described:
+                return
+            described.add(name)
+            kind, text = self.help.get(name, (default_kind, name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), histogram in sorted(histograms.items()):
+            header(name, "histogram")
+            for bound, count in zip(METRIC_BUCKETS, histogram["buckets"]):
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{self._labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.describe("payzoll_stage_duration_seconds", "histogram", "Time spent in each stage of the agent pipeline and bulk transfers")
+metrics.describe("payzoll_tool_calls_total", "counter", "Function calls dispatched by the model, by tool and outcome")
+metrics.describe("payzoll_openai_requests_total", "counter", "OpenAI chat completion requests by model and caller")
+metrics.describe("payzoll_rpc_requests_total", "counter", "JSON-RPC requests sent to blockchain nodes by method")
+metrics.describe("payzoll_rpc_duration_seconds", "histogram", "JSON-RPC request latency by method")
+metrics.describe("payzoll_transfers_total", "counter", "Bulk transfer transactions by outcome")
+metrics.describe("payzoll_tx_replacements_total", "counter", "Stuck transactions rebroadcast with bumped fees")
+metrics.describe("payzoll_api_requests_total", "counter", "Requests handled by the /api endpoint")
+
+# Every payzoll_stage_duration_seconds series has the same labels; the ones that
+# don't apply to a stage are left empty
+STAGE_LABELS = ("model", "caller", "tool", "resource")
+
+# Per-request state (stage timings etc.) for the thread serving the request
+_request_state = threading.local()
+
+def stage_labels(stage, **labels):
+    """
+    Returns the full label set of a stage duration series.
+    """
+    unknown = set(labels) - set(STAGE_LABELS)
+    if unknown:
+        raise ValueError(f"Unknown stage labels: {sorted(unknown)}")
+    return dict({name: str(labels.get(name) or "") for name in STAGE_LABELS}, stage=stage)
+
+def record_stage(stage, seconds, timings=None, **labels):
+    """
+    Records a stage duration in the metrics registry and in the request's timings.
+    """
+    metrics.observe("payzoll_stage_duration_seconds", seconds, stage_labels(stage, **labels))
+    if timings is None:
+        timings = getattr(_request_state, "timings", None)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds * 1000
+
+@contextmanager
+def stage_timer(stage, timings=None, **labels):
+    """
+    Times the enclosed block as one stage of the current request.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started, timings, **labels)
+
+def current_timings():
+    """
+    Returns the stage timings dict of the current request, or None outside of one.
+    """
+    return getattr(_request_state, "timings", None)
 
 # ----------------------
-# Reddit API configuration using PRAW
+# Lazy Third-Party Clients
 # ----------------------
-reddit = praw.Reddit(
-    client_id=os.getenv("REDDIT_CLIENT_ID"),
-    client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-    username=os.getenv("REDDIT_USERNAME"),
-    password=os.getenv("REDDIT_PASSWORD"),
-    user_agent=os.getenv("REDDIT_USER_AGENT")
-)
+# web3, tweepy and praw are heavy to import and most requests never touch them, so
+# they are imported and constructed on first use instead of at module load. This
+# keeps cold start on scale-to-zero hosts down to Flask + OpenAI.
+_lazy_clients = {}
+_lazy_clients_lock = threading.RLock()
+
+def lazy_client(name, factory):
+    """
+    Returns the named client, constructing it with factory() exactly once even when
+    several request threads ask for it at the same time.
+    """
+    client = _lazy_clients.get(name)
+    if client is None:
+        with _lazy_clients_lock:
+            client = _lazy_clients.get(name)
+            if client is None:
+                client = factory()
+                _lazy_clients[name] = client
+    return client
+
+def _build_twitter_client():
+    import tweepy
+
+    return tweepy.Client(
+        bearer_token=os.getenv("BEARER_KEY"),
+        consumer_key=os.getenv("CONSUMER_KEY"),
+        consumer_secret=os.getenv("CONSUMER_SECRET"),
+        access_token=os.getenv("ACCESS_KEY"),
+        access_token_secret=os.getenv("ACCESS_SECRET")
+    )
+
+def _build_reddit_client():
+    import praw
+
+    return praw.Reddit(
+        client_id=os.getenv("REDDIT_CLIENT_ID"),
+        client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
+        username=os.getenv("REDDIT_USERNAME"),
+        password=os.getenv("REDDIT_PASSWORD"),
+        user_agent=os.getenv("REDDIT_USER_AGENT")
+    )
+
+def _import_web3():
+    from web3 import Web3
+
+    return Web3
+
+def get_twitter_client():
+    """
+    Twitter API client using Tweepy.
+    """
+    return lazy_client("twitter", _build_twitter_client)
+
+def get_reddit_client():
+    """
+    Reddit API client using PRAW.
+    """
+    return lazy_client("reddit", _build_reddit_client)
+
+def _build_timed_provider_class():
+    Web3 = lazy_client("web3", _import_web3)
+
+    class TimedHTTPProvider(Web3.HTTPProvider):
+        """
+        HTTP provider that records JSON-RPC request counts and latency per method.
+        """
+        def make_request(self, method, params):
+            started = time.perf_counter()
+            try:
+                return super().make_request(method, params)
+            finally:
+                metrics.inc("payzoll_rpc_requests_total", {"method": method})
+                metrics.observe("payzoll_rpc_duration_seconds", time.perf_counter() - started, {"method": method})
+
+        def make_batch_request(self, batch_requests):
+            started = time.perf_counter()
+            try:
+                return super().make_batch_request(batch_requests)
+            finally:
+                for method, _ in batch_requests:
+                    metrics.inc("payzoll_rpc_requests_total", {"method": method})
+                metrics.observe("payzoll_rpc_duration_seconds", time.perf_counter() - started, {"method": "batch"})
+
+    return TimedHTTPProvider
+
+def connect_web3(rpc_url):
+    """
+    Returns a Web3 instance for the given RPC URL, importing web3 on first use.
+    """
+    Web3 = lazy_client("web3", _import_web3)
+    provider_class = lazy_client("web3_timed_provider", _build_timed_provider_class)
+    return Web3(provider_class(rpc_url))
+
+# ----------------------
+# OpenAI Chat Completions
+# ----------------------
+def chat_completion(caller, **kwargs):
+    """
+    Sends a chat completion request on behalf of caller (the tool or pipeline step
+    making it), recording its latency, count and token usage per model. Requests of
+    a tenant or session that spent its budget go to the fallback model.
+    """
+    context = current_usage_context()
+    if context and context.get("budget") == "exhausted":
+        kwargs["model"] = BUDGET_FALLBACK_MODEL
+    model = kwargs.get("model")
+    metrics.inc("payzoll_openai_requests_total", {"model": model, "caller": caller})
+    with stage_timer("openai_request", model=model, caller=caller):
+        response = openai.ChatCompletion.create(**kwargs)
+    usage_ledger.record(caller, model, response.get("usage"), context)
+    return response
+
+# ----------------------
+# Model Routing (tiers)
+# ----------------------
+# Completions go to a tier of MODEL_TIERS (cheapest first) instead of a hardcoded
+# model. Tools have a default tier: the inner chat hop and one-liner posts use the
+# fast tier. Agent turns are classified by intent, the tools they will likely need and
+# prompt size. A fast-tier answer is retried on the next tier when its function call
+# is malformed (unknown tool, bad JSON, missing required arguments) or its mean token
+# probability is below ROUTING_MIN_CONFIDENCE. Per-tier latency and escalations are
+# exported on /metrics for tuning the policy.
+MODEL_TIERS = json.loads(os.getenv("MODEL_TIERS", "") or '{"fast": "gpt-4o-mini", "strong": "gpt-4o"}')
+MODEL_TIER_ORDER = tuple(MODEL_TIERS)
+ROUTING_ENABLED = os.getenv("MODEL_ROUTING", "on").lower() not in ("off", "0", "false")
+ROUTING_CALLER_TIERS = dict({
+    "chat_with_ai": "fast",
+    "generate_post": "fast",
+    "generate_campaign": "fast",
+    "crypto_knowledge_query": "fast",
+    "transaction_insights": "strong",
+}, **json.loads(os.getenv("MODEL_ROUTES", "") or "{}"))
+ROUTING_MIN_CONFIDENCE = float(os.getenv("ROUTING_MIN_CONFIDENCE", "0.55"))
+ROUTING_FAST_MAX_PROMPT_TOKENS = int(os.getenv("ROUTING_FAST_MAX_PROMPT_TOKENS", "2000"))
+ROUTING_FAST_MAX_MESSAGE_CHARS = int(os.getenv("ROUTING_FAST_MAX_MESSAGE_CHARS", "600"))
+
+metrics.describe("payzoll_model_tier_requests_total", "counter", "Completions sent to each model tier, by caller")
+metrics.describe("payzoll_model_tier_duration_seconds", "histogram", "Completion latency per model tier and caller")
+metrics.describe("payzoll_model_escalations_total", "counter", "Answers retried on a higher tier, by caller and reason")
+
+def _tier(name):
+    """
+    Returns name if it is a configured tier, else the strongest tier.
+    """
+    if ROUTING_ENABLED and name in MODEL_TIERS:
+        return name
+    return MODEL_TIER_ORDER[-1]
+
+def classify_turn(message, system_prompt=None):
+    """
+    Picks the tier for an agent turn: payroll and transfer intents, long messages and
+    large prompts go to the strongest tier, everything else to the cheapest. Only the
+    system prompt and the new message count towards the prompt size: the chat history
+    grows every turn and would soon send every conversation to the strongest tier.
+    Returns (tier, reason).
+    """
+    if not ROUTING_ENABLED:
+        return _tier(None), "routing_off"
+    if classify_priority(message) == "high":
+        return _tier(None), "payroll_intent"
+    if len(message) > ROUTING_FAST_MAX_MESSAGE_CHARS:
+        return _tier(None), "long_message"
+    prompt_chars = len(message) + len(str((system_prompt or {}).get("content") or ""))
+    if prompt_chars // 4 > ROUTING_FAST_MAX_PROMPT_TOKENS:
+        return _tier(None), "prompt_size"
+    return _tier(MODEL_TIER_ORDER[0]), "simple"
+
+def _malformed_function_call(response, functions):
+    """
+    Returns why the response's function call can't be dispatched, or None.
+    """
+    call = response["choices"][0]["message"].get("function_call")
+    if not call or not functions:
+        return None
+    schema = next((f for f in functions if f["name"] == call.get("name")), None)
+    if schema is None:
+        return "unknown_function"
+    try:
+        args = json.loads(call.get("arguments") or "{}")
+    except ValueError:
+        return "invalid_arguments"
+    if not isinstance(args, dict):
+        return "invalid_arguments"
+    if any(key not in args for key in schema.get("parameters", {}).get("required", [])):
+        return "missing_arguments"
+    return None
+
+def _answer_confidence(response):
+    """
+    Mean token probability of the first answer, or None without logprobs (function calls).
+    """
+    logprobs = (response["choices"][0].get("logprobs") or {}).get("content")
+    if not logprobs:
+        return None
+    return math.exp(sum(token["logprob"] for token in logprobs) / len(logprobs))
+
+def routed_completion(caller, tier=None, reason="caller_default", **kwargs):
+    """
+    Sends a chat completion on the given tier (default: the caller's) and escalates
+    malformed or low-confidence answers tier by tier. Returns (response, route) where
+    route names the tier and model that answered and any escalations.
+    """
+    index = MODEL_TIER_ORDER.index(_tier(tier or ROUTING_CALLER_TIERS.get(caller)))
+    context = current_usage_context()
+    # Over budget every tier is the fallback model anyway, so don't pay twice
+    exhausted = bool(context and context.get("budget") == "exhausted")
+    escalations = []
+    while True:
+        tier_name = MODEL_TIER_ORDER[index]
+        can_escalate = index < len(MODEL_TIER_ORDER) - 1 and not exhausted
+        if can_escalate and ROUTING_MIN_CONFIDENCE > 0:
+            kwargs["logprobs"] = True
+        else:
+            kwargs.pop("logprobs", None)
+
+        started = time.perf_counter()
+        response = chat_completion(caller, model=MODEL_TIERS[tier_name], **kwargs)
+        labels = {"tier": tier_name, "caller": caller}
+        metrics.inc("payzoll_model_tier_requests_total", labels)
+        metrics.observe("payzoll_model_tier_duration_seconds", time.perf_counter() - started, labels)
+
+        problem = _malformed_function_call(response, kwargs.get("functions"))
+        if problem is None:
+            confidence = _answer_confidence(response)
+            if confidence is not None and confidence < ROUTING_MIN_CONFIDENCE:
+                problem = "low_confidence"
+        if problem is None or not can_escalate:
+            break
+        print(f"Escalating {caller} from {tier_name}: {problem}")
+        metrics.inc("payzoll_model_escalations_total", {"tier": tier_name, "caller": caller, "reason": problem})
+        escalations.append({"from": tier_name, "reason": problem})
+        index += 1
+
+    return response, {"tier": tier_name, "model": response.get("model") or MODEL_TIERS[tier_name],
+                      "reason": reason, "escalations": escalations}
 
 # ----------------------
 # Global Data Directory (local CSV files storage)
@@ -62,6 +444,585 @@ if not os.path.exists(CHAT_HISTORY_FILE):
 DEFAULT_EMPLOYEE_CSV = "company_employees.csv"
 DEFAULT_TRANSACTION_LOG = "bulk_transfer_log.csv"
 
+# ----------------------
+# Token Usage and Budgets
+# ----------------------
+# chat_completion records the usage block of every response against the calling
+# tool, the model and the tenant/session of the request (X-Tenant-Id / X-Session-Id
+# headers, believed only from ADMISSION_TRUSTED_PROXIES; other callers are their own
+# tenant and session, so budgets can't be escaped by rotating headers). Usage is
+# appended to data/usage_log.ndjson and kept in hourly buckets for the /api/usage
+# report. Optional daily budgets degrade service instead of failing: past
+# BUDGET_SOFT_LIMIT of a budget the chat history sent to the model is trimmed, and
+# once a budget is spent requests also switch to BUDGET_FALLBACK_MODEL.
+USAGE_LOG_FILE = os.path.join(DATA_DIR, "usage_log.ndjson")
+USAGE_RETENTION_HOURS = int(os.getenv("USAGE_RETENTION_HOURS", str(24 * 30)))
+# USD per million prompt / completion tokens
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+TENANT_DAILY_BUDGET_USD = float(os.getenv("TENANT_DAILY_BUDGET_USD", "0")) or None
+SESSION_DAILY_BUDGET_TOKENS = int(os.getenv("SESSION_DAILY_BUDGET_TOKENS", "0")) or None
+BUDGET_SOFT_LIMIT = float(os.getenv("BUDGET_SOFT_LIMIT", "0.8"))
+BUDGET_FALLBACK_MODEL = os.getenv("BUDGET_FALLBACK_MODEL", "gpt-4o-mini")
+BUDGET_TRIMMED_HISTORY = int(os.getenv("BUDGET_TRIMMED_HISTORY", "6"))
+USAGE_GROUPS = ("tool", "model", "tenant", "session")
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """
+    Estimated USD cost of a completion; models without a price count as zero.
+    """
+    price = MODEL_PRICES.get(model)
+    if price is None:
+        # Dated snapshots ("gpt-4o-2024-08-06") are priced like their base model
+        price = next((p for name, p in sorted(MODEL_PRICES.items(), key=lambda item: -len(item[0])) if model and model.startswith(name)), (0.0, 0.0))
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+def current_usage_context():
+    """
+    Returns the tenant/session/budget context of the current request, or None.
+    """
+    return getattr(_request_state, "usage_context", None)
+
+class UsageLedger:
+    """
+    Hourly token and cost totals keyed by tool, model, tenant and session, plus
+    per-day tenant spend and session tokens for budget checks. Buckets older than
+    USAGE_RETENTION_HOURS are dropped as the hour rolls over.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.buckets = None
+        self.tenant_day_usd = collections.Counter()
+        self.session_day_tokens = collections.Counter()
+        self.pruned_hour = None
+
+    def _add(self, record):
+        key = (record["hour"], record["tool"], record["model"], record["tenant"], record["session"])
+        bucket = self.buckets.setdefault(key, [0, 0, 0, 0.0])
+        bucket[0] += 1
+        bucket[1] += record["prompt_tokens"]
+        bucket[2] += record["completion_tokens"]
+        bucket[3] += record["cost_usd"]
+        day = record["hour"][:10]
+        self.tenant_day_usd[(day, record["tenant"])] += record["cost_usd"]
+        self.session_day_tokens[(day, record["tenant"], record["session"])] += record["prompt_tokens"] + record["completion_tokens"]
+
+    def _prune(self, hour):
+        """
+        Drops buckets past retention and day totals before today, once per hour.
+        """
+        if hour == self.pruned_hour:
+            return
+        self.pruned_hour = hour
+        cutoff_hour = datetime.fromtimestamp(datetime.now().timestamp() - USAGE_RETENTION_HOURS * 3600).strftime("%Y-%m-%d %H:00")
+        for key in [key for key in self.buckets if key[0] < cutoff_hour]:
+            del self.buckets[key]
+        today = hour[:10]
+        for totals in (self.tenant_day_usd, self.session_day_tokens):
+            for key in [key for key in totals if key[0] < today]:
+                del totals[key]
+
+    def _load(self):
+        if self.buckets is not None:
+            return
+        self.buckets = {}
+        cutoff = (datetime.now().timestamp() - USAGE_RETENTION_HOURS * 3600)
+        cutoff_hour = datetime.fromtimestamp(cutoff).strftime("%Y-%m-%d %H:00")
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("hour", "") >= cutoff_hour:
+                        self._add(record)
+        except FileNotFoundError:
+            pass
+
+    def record(self, tool, model, usage, context=None):
+        """
+        Adds one completion's usage; returns the record.
+        """
+        usage = usage or {}
+        context = context or {}
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+        record = {
+            "hour": datetime.now().strftime("%Y-%m-%d %H:00"),
+            "tool": tool,
+            "model": model,
+            "tenant": context.get("tenant", "default"),
+            "session": context.get("session", "none"),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": round(estimate_cost(model, prompt_tokens, completion_tokens), 6),
+        }
+        with self.lock:
+            self._load()
+            self._prune(record["hour"])
+            self._add(record)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        for kind in ("prompt", "completion"):
+            metrics.inc("payzoll_openai_tokens_total", {"model": model, "caller": tool, "kind": kind}, record[f"{kind}_tokens"])
+        if "request" in context:
+            totals = context["request"]
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["cost_usd"] = round(totals["cost_usd"] + record["cost_usd"], 6)
+        return record
+
+    def budget_level(self, tenant, session):
+        """
+        Returns "ok", "soft" (trim history) or "exhausted" (also use the fallback model)
+        from today's spend against the tenant and session budgets.
+        """
+        if TENANT_DAILY_BUDGET_USD is None and SESSION_DAILY_BUDGET_TOKENS is None:
+            return "ok"
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self.lock:
+            self._load()
+            tenant_usd = self.tenant_day_usd.get((today, tenant), 0.0)
+            session_tokens = self.session_day_tokens.get((today, tenant, session), 0)
+        used = max(
+            tenant_usd / TENANT_DAILY_BUDGET_USD if TENANT_DAILY_BUDGET_USD else 0.0,
+            session_tokens / SESSION_DAILY_BUDGET_TOKENS if SESSION_DAILY_BUDGET_TOKENS else 0.0,
+        )
+        if used >= 1.0:
+            return "exhausted"
+        if used >= BUDGET_SOFT_LIMIT:
+            return "soft"
+        return "ok"
+
+    def report(self, group_by="tool", hours=24, tenant=None):
+        """
+        Totals, per-group totals and an hourly timeline over the last `hours` hours.
+        """
+        cutoff_hour = datetime.fromtimestamp(datetime.now().timestamp() - hours * 3600).strftime("%Y-%m-%d %H:00")
+        index = USAGE_GROUPS.index(group_by) + 1
+        totals = [0, 0, 0, 0.0]
+        groups = collections.defaultdict(lambda: [0, 0, 0, 0.0])
+        timeline = collections.defaultdict(lambda: [0, 0, 0, 0.0])
+        with self.lock:
+            self._load()
+            items = list(self.buckets.items())
+        for key, bucket in items:
+            if key[0] < cutoff_hour or (tenant and key[3] != tenant):
+                continue
+            for target in (totals, groups[key[index]], timeline[key[0]]):
+                for i, value in enumerate(bucket):
+                    target[i] += value
+
+        def row(bucket, **extra):
+            return dict(extra, calls=bucket[0], prompt_tokens=bucket[1], completion_tokens=bucket[2],
+                        estimated_cost_usd=round(bucket[3], 4))
+
+        return {
+            "hours": hours,
+            "group_by": group_by,
+            "totals": row(totals),
+            "groups": sorted((row(bucket, **{group_by: name}) for name, bucket in groups.items()),
+                             key=lambda r: r["estimated_cost_usd"], reverse=True),
+            "timeline": [row(timeline[hour], hour=hour) for hour in sorted(timeline)],
+            "budgets": {
+                "tenant_daily_usd": TENANT_DAILY_BUDGET_USD,
+                "session_daily_tokens": SESSION_DAILY_BUDGET_TOKENS,
+                "soft_limit": BUDGET_SOFT_LIMIT,
+                "fallback_model": BUDGET_FALLBACK_MODEL
+            }
+        }
+
+usage_ledger = UsageLedger(USAGE_LOG_FILE)
+metrics.describe("payzoll_openai_tokens_total", "counter", "OpenAI tokens by model, caller and kind (prompt/completion)")
+
+# ----------------------
+# Record/Replay Cassettes
+# ----------------------
+# OpenAI (openai 0.28), Web3 HTTP providers, tweepy and praw all send their HTTP
+# calls through requests.Session, so one hook there records or replays every outbound
+# request. CASSETTE_MODE=record appends request/response pairs to CASSETTE_FILE;
+# CASSETTE_MODE=replay serves them back without touching the network, matching the
+# exact request first and otherwise the next unused response of the same service in
+# recorded order (prompts change as history grows). CASSETTE_LATENCY_MS adds a fixed
+# delay per replayed call, or "recorded" replays the recorded durations. The user
+# messages of each run are stored too, so `replay-run` can re-drive the same flow.
+# The file is JSON Lines and only ever appended to while recording; credentials are
+# redacted from request and response bodies and headers before they are written.
+CASSETTE_DIR = os.path.join(DATA_DIR, "cassettes")
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+CASSETTE_FILE = os.getenv("CASSETTE_FILE", os.path.join(CASSETTE_DIR, "default.json"))
+CASSETTE_LATENCY_MS = os.getenv("CASSETTE_LATENCY_MS", "")
+CASSETTE_REDACTED_KEYS = frozenset({"password", "client_secret", "api_key", "access_token", "refresh_token",
+                                    "id_token", "oauth_token", "oauth_token_secret"})
+CASSETTE_REDACTED_HEADERS = frozenset({"authorization", "proxy-authorization", "cookie", "set-cookie", "x-api-key"})
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """
+    Raised in replay mode when the cassette has no response for a request.
+    """
+
+def _cassette_service(url, body):
+    host = requests.utils.urlparse(url).netloc.lower()
+    if "openai" in host or url.rstrip("/").endswith("/chat/completions"):
+        return "openai"
+    if "twitter" in host or host.endswith("x.com") or url.startswith(TWITTER_API_BASE_URL):
+        return "twitter"
+    if "reddit" in host or url.startswith((REDDIT_API_BASE_URL, REDDIT_AUTH_BASE_URL)):
+        return "reddit"
+    if isinstance(body, (dict, list)) and "jsonrpc" in json.dumps(body)[:200]:
+        return "web3"
+    return "http"
+
+def _cassette_body(data, json_body):
+    """
+    Returns the request body as parsed JSON when possible, else as text.
+    """
+    if json_body is not None:
+        return json_body
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", errors="replace")
+    if isinstance(data, str):
+        try:
+            return json.loads(data)
+        except ValueError:
+            return data
+    if isinstance(data, dict):
+        return data
+    return None
+
+def _redact(value):
+    if isinstance(value, dict):
+        return {k: ("<redacted>" if str(k).lower() in CASSETTE_REDACTED_KEYS else _redact(v)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(v) for v in value]
+    return value
+
+def _redact_text(text, content_type=""):
+    """
+    Redacts a response body: JSON documents and form-encoded token responses.
+    """
+    try:
+        data = json.loads(text)
+        redacted = _redact(data)
+        return text if redacted == data else json.dumps(redacted)
+    except ValueError:
+        pass
+    if "x-www-form-urlencoded" in content_type.lower():
+        pairs = urllib.parse.parse_qsl(text, keep_blank_values=True)
+        return urllib.parse.urlencode([(k, "<redacted>" if k.lower() in CASSETTE_REDACTED_KEYS else v) for k, v in pairs])
+    return text
+
+def _strip_rpc_ids(body):
+    """
+    JSON-RPC ids are counters that differ between runs, so they're left out of the match key.
+    """
+    if isinstance(body, list):
+        return [_strip_rpc_ids(item) for item in body]
+    if isinstance(body, dict) and "jsonrpc" in body:
+        return {k: v for k, v in body.items() if k != "id"}
+    return body
+
+def _cassette_key(service, method, url, body):
+    canonical = json.dumps([service, method.upper(), url, _strip_rpc_ids(_redact(body))], sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class Cassette:
+    """
+    A file of recorded HTTP interactions plus the user messages that produced them.
+    One JSON record per line ({"flow": message} or {"interaction": {...}}), so
+    recording appends instead of rewriting the file. Version 1 files (a single JSON
+    document) are still read, and converted the first time they're recorded into.
+    """
+    def __init__(self, path, mode, latency_ms=""):
+        self.path = path
+        self.mode = mode
+        self.latency_ms = latency_ms
+        self.lock = threading.Lock()
+        self.interactions = []
+        self.flow = []
+        self.used = set()
+        if self._load() == 1 and mode == "record":
+            self.save()
+
+    def _load(self):
+        """
+        Reads the cassette file and returns its format version (None if missing).
+        """
+        try:
+            with open(self.path, "r") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and "interactions" in data:
+            self.interactions = data.get("interactions", [])
+            self.flow = data.get("flow", [])
+            return 1
+        for line in text.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A recording cut off mid-write leaves a partial last line
+                continue
+            if "interaction" in record:
+                self.interactions.append(record["interaction"])
+            elif "flow" in record:
+                self.flow.append(record["flow"])
+        return 2
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps({"version": 2}) + "\n")
+            for message in self.flow:
+                f.write(json.dumps({"flow": message}) + "\n")
+            for item in self.interactions:
+                f.write(json.dumps({"interaction": item}) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def _append(self, record):
+        line = json.dumps(record) + "\n"
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            if f.tell() == 0:
+                f.write(json.dumps({"version": 2}) + "\n")
+            f.write(line)
+
+    def note_message(self, message):
+        if self.mode == "record":
+            with self.lock:
+                self.flow.append(message)
+                self._append({"flow": message})
+
+    def record(self, service, key, method, url, body, response, elapsed):
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in CASSETTE_REDACTED_HEADERS}
+        item = {
+            "service": service,
+            "key": key,
+            "request": {"method": method.upper(), "url": url, "body": _redact(body)},
+            "response": {"status": response.status_code, "headers": headers,
+                         "body": _redact_text(response.text, response.headers.get("Content-Type", ""))},
+            "elapsed": round(elapsed, 4)
+        }
+        with self.lock:
+            self.interactions.append(item)
+            self._append({"interaction": item})
+
+    def find(self, service, key):
+        """
+        Returns the recorded interaction for a request: the first unused exact match,
+        else the next unused interaction of the same service, else the last exact match.
+        """
+        with self.lock:
+            exact = [i for i, item in enumerate(self.interactions) if item["key"] == key]
+            for i in exact:
+                if i not in self.used:
+                    self.used.add(i)
+                    return self.interactions[i]
+            for i, item in enumerate(self.interactions):
+                if item["service"] == service and i not in self.used:
+                    self.used.add(i)
+                    return item
+            return self.interactions[exact[-1]] if exact else None
+
+    def replay_response(self, item, method, url, body):
+        if self.latency_ms == "recorded":
+            time.sleep(item.get("elapsed", 0))
+        elif self.latency_ms:
+            time.sleep(float(self.latency_ms) / 1000)
+        recorded = item["response"]
+        content = recorded["body"]
+        # Echo the caller's JSON-RPC ids so web3 accepts the response
+        if isinstance(body, (dict, list)) and "jsonrpc" in json.dumps(body)[:200]:
+            try:
+                payload = json.loads(content)
+                if isinstance(body, dict) and isinstance(payload, dict):
+                    payload["id"] = body.get("id")
+                elif isinstance(body, list) and isinstance(payload, list):
+                    for request_item, response_item in zip(body, payload):
+                        response_item["id"] = request_item.get("id")
+                content = json.dumps(payload)
+            except ValueError:
+                pass
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.headers = requests.structures.CaseInsensitiveDict(recorded.get("headers") or {})
+        response._content = content.encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = url
+        response.reason = "Replayed"
+        response.request = requests.Request(method, url).prepare()
+        return response
+
+_cassette = None
+_original_session_request = requests.Session.request
+
+def _cassette_session_request(session, method, url, *args, **kwargs):
+    cassette = _cassette
+    if cassette is None:
+        return _original_session_request(session, method, url, *args, **kwargs)
+    params = kwargs.get("params")
+    if params:
+        url = requests.Request(method, url, params=params).prepare().url
+        kwargs.pop("params")
+    body = _cassette_body(kwargs.get("data"), kwargs.get("json"))
+    service = _cassette_service(url, body)
+    key = _cassette_key(service, method, url, body)
+    if cassette.mode == "replay":
+        item = cassette.find(service, key)
+        if item is None:
+            raise CassetteMiss(f"No recorded {service} response for {method.upper()} {url}")
+        return cassette.replay_response(item, method, url, body)
+    started = time.perf_counter()
+    response = _original_session_request(session, method, url, *args, **kwargs)
+    cassette.record(service, key, method, url, body, response, time.perf_counter() - started)
+    return response
+
+def activate_cassette(path, mode, latency_ms=""):
+    """
+    Routes all requests-based HTTP traffic through a cassette ("record" or "replay").
+    """
+    global _cassette
+    if mode not in ("record", "replay"):
+        raise ValueError(f"Unknown cassette mode: {mode}")
+    _cassette = Cassette(path, mode, latency_ms)
+    requests.Session.request = _cassette_session_request
+    print(f"Cassette {mode}: {path}")
+    return _cassette
+
+def note_cassette_message(message):
+    if _cassette is not None:
+        _cassette.note_message(message)
+
+LEGACY_FUNCTION_ARGS = {
+    "post_on_twitter": ["body"],
+    "post_on_reddit": ["subreddit", "title", "body"],
+    "generate_post": ["platform", "description"],
+}
+
+def import_transcript_cassette(transcript_paths, output_path):
+    """
+    Converts legacy bot transcripts (All_Companies/<company>/*.json) into a seed
+    cassette: each user reply becomes a flow message and the bot's answer becomes the
+    recorded OpenAI response (a function call when the bot named one). Tweets the bot
+    posted get a recorded Twitter response too.
+    """
+    flow, interactions = [], []
+    openai_url = f"{openai.api_base.rstrip('/')}/chat/completions"
+    for path in transcript_paths:
+        with open(path, "r") as f:
+            transcript = json.load(f)
+        for i, turn in enumerate(transcript):
+            if turn.get("role") != "user":
+                continue
+            try:
+                user = json.loads(turn["content"])
+                reply = json.loads(transcript[i + 1]["content"]) if i + 1 < len(transcript) else None
+            except (ValueError, KeyError):
+                continue
+            message = re.sub(r"^(<@\d+>\s*)+", "", user.get("Reply_From_The_User") or "").strip()
+            if not message or not reply:
+                # Backend callbacks have no counterpart in this agent's single-pass loop
+                continue
+            flow.append(message)
+
+            function_spec = (reply.get("Name_of_the_function") or "").strip()
+            tool_interactions = []
+            assistant = {"role": "assistant", "content": reply.get("Text_to_show_to_the_user") or ""}
+            finish_reason = "stop"
+            if function_spec:
+                name, *positional = next(csv.reader([function_spec], skipinitialspace=True))
+                arguments = dict(zip(LEGACY_FUNCTION_ARGS.get(name, []), positional))
+                assistant = {"role": "assistant", "content": None,
+                             "function_call": {"name": name, "arguments": json.dumps(arguments)}}
+                finish_reason = "function_call"
+                if name == "post_on_twitter":
+                    tweet_id = str(1900000000000000000 + len(interactions))
+                    tool_interactions.append({
+                        "service": "twitter", "key": None,
+                        "request": {"method": "POST", "url": "https://api.twitter.com/2/tweets", "body": {"text": arguments.get("body", "")}},
+                        "response": {"status": 201, "headers": {"Content-Type": "application/json"},
+                                     "body": json.dumps({"data": {"id": tweet_id, "text": arguments.get("body", "")}})},
+                        "elapsed": 0.3
+                    })
+            body = {
+                "id": f"chatcmpl-seed-{len(interactions)}",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-4o",
+                "choices": [{"index": 0, "message": assistant, "finish_reason": finish_reason}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            }
+            # Sequential fallback serves these in order: the completion, then the calls of its tool
+            interactions.append({
+                "service": "openai", "key": None,
+                "request": {"method": "POST", "url": openai_url, "body": {"messages": [{"role": "user", "content": message}]}},
+                "response": {"status": 200, "headers": {"Content-Type": "application/json"}, "body": json.dumps(body)},
+                "elapsed": 1.0
+            })
+            interactions += tool_interactions
+
+    cassette = Cassette(output_path, "record")
+    cassette.flow, cassette.interactions = flow, interactions
+    cassette.save()
+    return {"status": "success", "cassette": output_path, "messages": len(flow), "interactions": len(interactions)}
+
+def replay_cassette_run(path, latency_ms="", repeat=1):
+    """
+    Re-drives a cassette's recorded user messages through process_and_execute_message
+    offline and returns per-message and total timings. Uses a scratch chat history.
+    """
+    global CHAT_HISTORY_FILE
+    cassette = activate_cassette(path, "replay", latency_ms)
+    if not cassette.flow:
+        return {"status": "error", "message": f"Cassette has no recorded messages: {path}"}
+    openai.api_key = openai.api_key or "sk-replay"
+    saved_history_file = CHAT_HISTORY_FILE
+    os.makedirs(CASSETTE_DIR, exist_ok=True)
+    CHAT_HISTORY_FILE = os.path.join(CASSETTE_DIR, f".replay_history_{os.getpid()}.json")
+    turns = []
+    started = time.perf_counter()
+    try:
+        for run in range(repeat):
+            cassette.used.clear()
+            save_chat_history([])
+            for message in cassette.flow:
+                _request_state.timings = {}
+                turn_started = time.perf_counter()
+                result = process_and_execute_message(message)
+                turns.append({
+                    "run": run,
+                    "message": message[:80],
+                    "function": (result.get("function_details") or {}).get("name"),
+                    "ms": round((time.perf_counter() - turn_started) * 1000, 3),
+                    "timings": {stage: round(ms, 3) for stage, ms in _request_state.timings.items()}
+                })
+    finally:
+        _request_state.timings = None
+        if os.path.exists(CHAT_HISTORY_FILE):
+            os.remove(CHAT_HISTORY_FILE)
+        CHAT_HISTORY_FILE = saved_history_file
+    total_ms = (time.perf_counter() - started) * 1000
+    return {
+        "status": "success",
+        "turns": turns,
+        "summary": {"runs": repeat, "messages": len(turns), "total_ms": round(total_ms, 3),
+                    "mean_turn_ms": round(total_ms / len(turns), 3)}
+    }
+
+if CASSETTE_MODE != "off":
+    activate_cassette(CASSETTE_FILE, CASSETTE_MODE, CASSETTE_LATENCY_MS)
+
 # ----------------------
 # Chat History Functions
 # ----------------------
@@ -91,7 +1052,7 @@ def chat_with_ai(user_message):
     messages = [{"role": "system", "content": "You are an AI assistant."}]
     messages.append({"role": "user", "content": user_message})
     
-    response = openai.ChatCompletion.create(model="gpt-4o", messages=messages)
+    response, _ = routed_completion("chat_with_ai", messages=messages)
     ai_response = response["choices"][0]["message"]["content"]
     
     return {"status": "success", "response": ai_response}
@@ -104,7 +1065,7 @@ def post_on_twitter(body):
     Posts a tweet using the Twitter API.
     """
     try:
-        twitter_client.create_tweet(text=body)
+        get_twitter_client().create_tweet(text=body)
         return {"status": "success", "message": "Tweet posted successfully!"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -117,36 +1078,717 @@ def post_on_reddit(subreddit_name, title, body):
     Posts on Reddit using the PRAW API.
     """
     try:
-        subreddit = reddit.subreddit(subreddit_name)
+        subreddit = get_reddit_client().subreddit(subreddit_name)
         submission = subreddit.submit(title, selftext=body)
         return {"status": "success", "message": "Reddit post submitted successfully!"}
     
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+# ----------------------
+# Cross-Posting Engine (rate-limit aware, persistent outbox)
+# ----------------------
+# cross_post fans one post out to Twitter and any number of subreddits concurrently.
+# The request returns an outbox id immediately; delivery happens on a worker pool,
+# gated by per-platform token buckets that are corrected from the rate-limit headers
+# each platform returns. Failed deliveries are retried with exponential backoff and
+# the outbox is persisted so pending posts survive a restart. The base URLs can be
+# pointed at local fake servers for testing.
+TWITTER_API_BASE_URL = os.getenv("TWITTER_API_BASE_URL", "https://api.twitter.com").rstrip("/")
+REDDIT_API_BASE_URL = os.getenv("REDDIT_API_BASE_URL", "https://oauth.reddit.com").rstrip("/")
+REDDIT_AUTH_BASE_URL = os.getenv("REDDIT_AUTH_BASE_URL", "https://www.reddit.com").rstrip("/")
+OUTBOX_FILE = os.path.join(DATA_DIR, "outbox.json")
+OUTBOX_MAX_ENTRIES = int(os.getenv("OUTBOX_MAX_ENTRIES", "1000"))
+POST_CONCURRENCY = int(os.getenv("POST_CONCURRENCY", "8"))
+POST_MAX_ATTEMPTS = int(os.getenv("POST_MAX_ATTEMPTS", "5"))
+POST_RETRY_BASE_SECONDS = float(os.getenv("POST_RETRY_BASE_SECONDS", "2"))
+POST_RETRY_MAX_SECONDS = float(os.getenv("POST_RETRY_MAX_SECONDS", "300"))
+POST_HTTP_TIMEOUT = float(os.getenv("POST_HTTP_TIMEOUT", "15"))
+
+# Requests allowed per window before the platform headers tell us otherwise
+PLATFORM_RATE_LIMITS = {
+    "twitter": (int(os.getenv("TWITTER_POSTS_PER_WINDOW", "100")), 15 * 60),
+    "reddit": (int(os.getenv("REDDIT_REQUESTS_PER_WINDOW", "100")), 60),
+}
+
+class TokenBucket:
+    """
+    Token bucket limiter whose state is corrected by the platform's rate-limit headers.
+    """
+    def __init__(self, capacity, window_seconds):
+        self.capacity = float(capacity)
+        self.rate = capacity / float(window_seconds)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """
+        Takes a token and returns 0, or returns the seconds to wait before trying again.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.blocked_until:
+                # The platform window has reset, so the full quota is available again
+                self.blocked_until = 0.0
+                self.tokens = self.capacity
+                self.updated = now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def update(self, remaining=None, reset_in=None):
+        """
+        Applies the remaining quota and seconds-until-reset reported by the platform.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+            if reset_in is not None and (remaining is None or remaining < 1):
+                self.tokens = 0.0
+                self.blocked_until = max(self.blocked_until, now + max(reset_in, 0.0))
+
+def _header_float(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+def _twitter_rate_limit(headers):
+    """
+    Twitter reports x-rate-limit-remaining and x-rate-limit-reset (epoch seconds).
+    """
+    reset_at = _header_float(headers, "x-rate-limit-reset")
+    reset_in = reset_at - time.time() if reset_at is not None else None
+    return _header_float(headers, "x-rate-limit-remaining"), reset_in
+
+def _reddit_rate_limit(headers):
+    """
+    Reddit reports x-ratelimit-remaining and x-ratelimit-reset (seconds from now).
+    """
+    return _header_float(headers, "x-ratelimit-remaining"), _header_float(headers, "x-ratelimit-reset")
+
+def _twitter_send(target, content):
+    """
+    Creates a tweet through the v2 API and returns the HTTP response.
+    """
+    from requests_oauthlib import OAuth1
+
+    auth = OAuth1(
+        os.getenv("CONSUMER_KEY"),
+        os.getenv("CONSUMER_SECRET"),
+        os.getenv("ACCESS_KEY"),
+        os.getenv("ACCESS_SECRET")
+    )
+    return requests.post(
+        f"{TWITTER_API_BASE_URL}/2/tweets",
+        json={"text": content["body"]},
+        auth=auth,
+        timeout=POST_HTTP_TIMEOUT
+    )
+
+_reddit_token = {"value": None, "expires_at": 0.0}
+_reddit_token_lock = threading.Lock()
+
+def _reddit_access_token():
+    """
+    Returns a cached script-app OAuth token, fetching a new one when it is about to expire.
+    """
+    with _reddit_token_lock:
+        if _reddit_token["value"] and time.time() < _reddit_token["expires_at"] - 60:
+            return _reddit_token["value"]
+        response = requests.post(
+            f"{REDDIT_AUTH_BASE_URL}/api/v1/access_token",
+            auth=(os.getenv("REDDIT_CLIENT_ID"), os.getenv("REDDIT_CLIENT_SECRET")),
+            data={
+                "grant_type": "password",
+                "username": os.getenv("REDDIT_USERNAME"),
+                "password": os.getenv("REDDIT_PASSWORD")
+            },
+            headers={"User-Agent": os.getenv("REDDIT_USER_AGENT") or "PayZollBot"},
+            timeout=POST_HTTP_TIMEOUT
+        )
+        response.raise_for_status()
+        payload = response.json()
+        _reddit_token["value"] = payload["access_token"]
+        _reddit_token["expires_at"] = time.time() + float(payload.get("expires_in", 3600))
+        return _reddit_token["value"]
+
+def _reddit_send(target, content):
+    """
+    Submits a self post to the target subreddit and returns the HTTP response.
+    """
+    return requests.post(
+        f"{REDDIT_API_BASE_URL}/api/submit",
+        data={
+            "sr": target["subreddit"],
+            "kind": "self",
+            "title": content["title"],
+            "text": content["body"],
+            "api_type": "json"
+        },
+        headers={
+            "Authorization": f"bearer {_reddit_access_token()}",
+            "User-Agent": os.getenv("REDDIT_USER_AGENT") or "PayZollBot"
+        },
+        timeout=POST_HTTP_TIMEOUT
+    )
+
+def _twitter_outcome(response):
+    """
+    Maps a tweet response to (posted, retryable, remote_id, error).
+    """
+    if response.status_code in (200, 201):
+        return True, False, response.json().get("data", {}).get("id"), None
+    retryable = response.status_code == 429 or response.status_code >= 500
+    return False, retryable, None, f"HTTP {response.status_code}: {response.text[:200]}"
+
+def _reddit_outcome(response):
+    """
+    Maps a submit response to (posted, retryable, remote_id, error). Reddit reports
+    its own RATELIMIT errors inside a 200 body.
+    """
+    if response.status_code != 200:
+        retryable = response.status_code == 429 or response.status_code >= 500
+        return False, retryable, None, f"HTTP {response.status_code}: {response.text[:200]}"
+    body = response.json().get("json", {})
+    errors = body.get("errors") or []
+    if errors:
+        retryable = any(err and err[0] == "RATELIMIT" for err in errors)
+        return False, retryable, None, "; ".join(" ".join(str(part) for part in err) for err in errors)
+    return True, False, body.get("data", {}).get("id"), None
+
+PLATFORM_TRANSPORTS = {
+    "twitter": (_twitter_send, _twitter_outcome, _twitter_rate_limit),
+    "reddit": (_reddit_send, _reddit_outcome, _reddit_rate_limit),
+}
+
+class PostingEngine:
+    """
+    Delivers outbox entries to their targets concurrently, honouring per-platform
+    rate limits and retrying transient failures with exponential backoff.
+    """
+    def __init__(self, outbox_file, concurrency):
+        self.outbox_file = outbox_file
+        self.concurrency = concurrency
+        self.lock = threading.RLock()
+        self.wakeup = threading.Condition(self.lock)
+        self.entries = None
+        self.schedule = []
+        self.executor = None
+        self.limiters = {platform: TokenBucket(*limit) for platform, limit in PLATFORM_RATE_LIMITS.items()}
+
+    def start(self):
+        """
+        Loads the outbox and starts the scheduler on first use, re-queueing anything
+        that was still pending when the server stopped.
+        """
+        with self.lock:
+            if self.executor is not None:
+                return
+            try:
+                with open(self.outbox_file, "r") as f:
+                    self.entries = json.load(f)
+            except Exception:
+                self.entries = {}
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="outbox")
+            threading.Thread(target=self._run_scheduler, name="outbox-scheduler", daemon=True).start()
+            for entry in self.entries.values():
+                for idx, target in enumerate(entry["targets"]):
+                    if target["status"] in ("queued", "sending"):
+                        target["status"] = "queued"
+                        self._schedule(entry["id"], idx, 0)
+
+    def submit(self, targets, title, body):
+        """
+        Stores a new outbox entry and queues delivery to every target. Returns the entry.
+        """
+        self.start()
+        entry = {
+            "id": uuid.uuid4().hex,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "content": {"title": title, "body": body},
+            "status": "pending",
+            "targets": [dict(target, status="queued", attempts=0, error=None, remote_id=None) for target in targets]
+        }
+        with self.lock:
+            self.entries[entry["id"]] = entry
+            self._prune()
+            self._save()
+            for idx in range(len(entry["targets"])):
+                self._schedule(entry["id"], idx, 0)
+        return entry
+
+    def get(self, outbox_id):
+        self.start()
+        with self.lock:
+            entry = self.entries.get(outbox_id)
+            return json.loads(json.dumps(entry)) if entry else None
+
+    def _prune(self):
+        finished = [e for e in self.entries.values() if e["status"] != "pending"]
+        for entry in finished[:max(0, len(self.entries) - OUTBOX_MAX_ENTRIES)]:
+            del self.entries[entry["id"]]
+
+    def _save(self):
+        tmp_path = f"{self.outbox_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.outbox_file)
+
+    def _schedule(self, entry_id, idx, delay):
+        heapq.heappush(self.schedule, (time.monotonic() + delay, entry_id, idx))
+        self.wakeup.notify()
+
+    def _run_scheduler(self):
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                if self.schedule and self.schedule[0][0] <= now:
+                    _, entry_id, idx = heapq.heappop(self.schedule)
+                    self.executor.submit(self._deliver, entry_id, idx)
+                    continue
+                self.wakeup.wait(self.schedule[0][0] - now if self.schedule else None)
+
+    def _deliver(self, entry_id, idx):
+        with self.lock:
+            entry = self.entries.get(entry_id)
+            if entry is None:
+                return
+            target = entry["targets"][idx]
+            content = entry["content"]
+        platform = target["platform"]
+        send, outcome, rate_limit = PLATFORM_TRANSPORTS[platform]
+        limiter = self.limiters[platform]
+
+        wait = limiter.try_acquire()
+        if wait > 0:
+            with self.lock:
+                self._schedule(entry_id, idx, wait)
+            return
+
+        with self.lock:
+            target["status"] = "sending"
+            target["attempts"] += 1
+        retry_after = None
+        try:
+            response = send(target, content)
+            remaining, reset_in = rate_limit(response.headers)
+            retry_after = _header_float(response.headers, "retry-after") or reset_in
+            if response.status_code == 429:
+                limiter.update(remaining=0, reset_in=retry_after)
+            else:
+                limiter.update(remaining=remaining, reset_in=reset_in)
+            posted, retryable, remote_id, error = outcome(response)
+        except Exception as e:
+            posted, retryable, remote_id, error = False, True, None, str(e)
+
+        with self.lock:
+            target["error"] = error
+            if posted:
+                target["status"] = "posted"
+                target["remote_id"] = remote_id
+            elif retryable and target["attempts"] < POST_MAX_ATTEMPTS:
+                backoff = min(POST_RETRY_MAX_SECONDS, POST_RETRY_BASE_SECONDS * 2 ** (target["attempts"] - 1))
+                delay = max(backoff, retry_after or 0) * random.uniform(1.0, 1.25)
+                target["status"] = "queued"
+                self._schedule(entry_id, idx, delay)
+            else:
+                target["status"] = "failed"
+            statuses = {t["status"] for t in entry["targets"]}
+            if statuses <= {"posted"}:
+                entry["status"] = "posted"
+            elif statuses <= {"posted", "failed"}:
+                entry["status"] = "failed" if statuses == {"failed"} else "partial"
+            self._save()
+
+posting_engine = PostingEngine(OUTBOX_FILE, POST_CONCURRENCY)
+
+# ----------------------
+# Function: Cross-Post to Twitter and Reddit
+# ----------------------
+def cross_post(body, title=None, twitter=True, subreddits=None):
+    """
+    Queues a post for Twitter and/or several subreddits and returns its outbox id
+    without waiting for delivery.
+    """
+    targets = [{"platform": "twitter"}] if twitter else []
+    for subreddit in subreddits or []:
+        targets.append({"platform": "reddit", "subreddit": subreddit})
+    if not targets:
+        return {"status": "error", "message": "No targets given. Enable twitter or list subreddits."}
+    if not body:
+        return {"status": "error", "message": "Post body is required."}
+
+    try:
+        entry = posting_engine.submit(targets, title or body[:100], body)
+        return {"status": "success", "outbox_id": entry["id"], "targets": len(targets)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
 # ----------------------
 # Function: Generate Social Media Post
 # ----------------------
+def _post_prompt(platform, description):
+    if platform == "twitter":
+        return f"Generate a one-liner tweet about: {description}"
+    if platform == "reddit":
+        return f"Generate a one-liner reddit post about: {description}"
+    return None
+
 def generate_post(platform, description):
     """
     Generates a one-liner social media post using OpenAI's GPT.
     """
-    if platform == "twitter":
-        prompt = f"Generate a one-liner tweet about: {description}"
-    elif platform == "reddit":
-        prompt = f"Generate a one-liner reddit post about: {description}"
-    else:
+    prompt = _post_prompt(platform, description)
+    if prompt is None:
         return {"status": "error", "message": "Platform not supported. Choose 'twitter' or 'reddit'."}
     
     messages = [
         {"role": "system", "content": "You are a creative social media content generator."},
         {"role": "user", "content": prompt}
     ]
-    response = openai.ChatCompletion.create(model="gpt-4o", messages=messages)
+    response, _ = routed_completion("generate_post", messages=messages)
     generated_post = response["choices"][0]["message"]["content"].strip()
     
     return {"status": "success", "post": generated_post}
 
+# ----------------------
+# Function: Generate a Post Campaign (batch)
+# ----------------------
+# A campaign is a list of (platform, topic, variants) jobs. Each job is one completion
+# asking for all its variants at once (n choices), jobs run concurrently under a cap,
+# and near-identical posts are dropped before the rest are scored and ranked.
+CAMPAIGN_CONCURRENCY = int(os.getenv("CAMPAIGN_CONCURRENCY", "8"))
+CAMPAIGN_MAX_VARIANTS = 10
+CAMPAIGN_MAX_JOBS = 100
+CAMPAIGN_DUPLICATE_SIMILARITY = 0.7
+PLATFORM_MAX_CHARS = {"twitter": 280, "reddit": 300}
+
+def _post_tokens(text):
+    return set(re.findall(r"[a-z0-9']+", text.lower()))
+
+def _similarity(a_tokens, b_tokens):
+    if not a_tokens or not b_tokens:
+        return 0.0
+    return len(a_tokens & b_tokens) / len(a_tokens | b_tokens)
+
+def score_post(platform, topic, post, novelty):
+    """
+    Scores a post from 0 to 1 on fit for the platform's length, topic coverage,
+    hashtag restraint and how different it is from the posts already kept.
+    """
+    limit = PLATFORM_MAX_CHARS.get(platform, 280)
+    length = len(post)
+    if length > limit:
+        length_score = 0.0
+    else:
+        length_score = min(1.0, length / (limit * 0.4))
+    topic_tokens = {token for token in _post_tokens(topic) if token not in STOPWORDS}
+    coverage = len(topic_tokens & _post_tokens(post)) / len(topic_tokens) if topic_tokens else 1.0
+    hashtags = post.count("#")
+    hashtag_score = 1.0 if hashtags <= 2 else max(0.0, 1.0 - 0.25 * (hashtags - 2))
+    score = 0.35 * length_score + 0.3 * coverage + 0.15 * hashtag_score + 0.2 * novelty
+    return round(score, 4)
+
+def _generate_variants(job, context=None):
+    # Runs on a pool thread; carry the request's usage context over
+    _request_state.usage_context = context
+    prompt = _post_prompt(job["platform"], job["topic"])
+    messages = [
+        {"role": "system", "content": "You are a creative social media content generator. Every answer must take a different angle."},
+        {"role": "user", "content": prompt}
+    ]
+    response, _ = routed_completion("generate_campaign", messages=messages, n=job["variants"], temperature=1.0)
+    return [choice["message"]["content"].strip().strip('"') for choice in response["choices"]]
+
+def generate_campaign(jobs, max_concurrency=None):
+    """
+    Generates posts for a batch of jobs [{"platform", "topic", "variants"}] concurrently,
+    drops near-duplicates per platform and returns the posts scored, best first per job.
+    """
+    if not jobs:
+        return {"status": "error", "message": "No campaign jobs provided."}
+    if len(jobs) > CAMPAIGN_MAX_JOBS:
+        return {"status": "error", "message": f"At most {CAMPAIGN_MAX_JOBS} jobs per campaign."}
+
+    normalized = []
+    for job in jobs:
+        platform = (job.get("platform") or "").lower()
+        if _post_prompt(platform, "") is None:
+            return {"status": "error", "message": f"Platform not supported: {job.get('platform')}. Choose 'twitter' or 'reddit'."}
+        if not job.get("topic"):
+            return {"status": "error", "message": "Every campaign job needs a topic."}
+        variants = max(1, min(int(job.get("variants") or 1), CAMPAIGN_MAX_VARIANTS))
+        normalized.append({"platform": platform, "topic": job["topic"], "variants": variants})
+
+    workers = max(1, min(max_concurrency or CAMPAIGN_CONCURRENCY, len(normalized)))
+    with stage_timer("campaign_generation"), ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_generate_variants, job, current_usage_context()) for job in normalized]
+
+    kept_tokens = collections.defaultdict(list)
+    results = []
+    duplicates = 0
+    generated = 0
+    for job, future in zip(normalized, futures):
+        entry = dict(job, posts=[])
+        try:
+            drafts = future.result()
+        except Exception as e:
+            entry["error"] = str(e)
+            results.append(entry)
+            continue
+        generated += len(drafts)
+        for post in drafts:
+            tokens = _post_tokens(post)
+            closest = max((_similarity(tokens, other) for other in kept_tokens[job["platform"]]), default=0.0)
+            if not post or closest >= CAMPAIGN_DUPLICATE_SIMILARITY:
+                duplicates += 1
+                continue
+            kept_tokens[job["platform"]].append(tokens)
+            entry["posts"].append({"post": post, "score": score_post(job["platform"], job["topic"], post, 1.0 - closest)})
+        entry["posts"].sort(key=lambda p: p["score"], reverse=True)
+        results.append(entry)
+
+    failed = sum(1 for entry in results if "error" in entry)
+    return {
+        "status": "success" if failed < len(results) else "error",
+        "campaign": results,
+        "summary": {
+            "jobs": len(results),
+            "failed_jobs": failed,
+            "generated": generated,
+            "duplicates_removed": duplicates,
+            "posts": generated - duplicates
+        }
+    }
+
+# ----------------------
+# Comment Sentiment Analysis
+# ----------------------
+# Comments on our tweets and Reddit submissions are pulled through the Twitter/Reddit
+# clients (or a local fixture file when SENTIMENT_FIXTURE is set) and scored locally
+# with a small valence lexicon, in batches, instead of one model call per comment.
+# Scores are cached per comment id, so re-runs only score comments that are new.
+SENTIMENT_FIXTURE = os.getenv("SENTIMENT_FIXTURE")
+SENTIMENT_CACHE_FILE = os.path.join(DATA_DIR, "sentiment_cache.json")
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "500"))
+SENTIMENT_MAX_COMMENTS = int(os.getenv("SENTIMENT_MAX_COMMENTS", "1000"))
+SENTIMENT_LEXICON_VERSION = 1
+
+SENTIMENT_LEXICON = {
+    # positive
+    "love": 3.0, "loved": 3.0, "loving": 2.5, "awesome": 3.0, "amazing": 3.0, "excellent": 3.0,
+    "great": 2.5, "fantastic": 3.0, "brilliant": 3.0, "incredible": 2.5, "impressive": 2.5,
+    "good": 1.9, "nice": 1.8, "cool": 1.3, "like": 1.0, "liked": 1.2, "helpful": 1.8,
+    "useful": 1.7, "easy": 1.5, "simple": 1.0, "fast": 1.5, "quick": 1.2, "instant": 1.2,
+    "cheap": 1.0, "cheaper": 1.2, "secure": 1.6, "safe": 1.5, "transparent": 1.4, "reliable": 1.9,
+    "innovative": 2.0, "revolutionary": 2.0, "smooth": 1.6, "seamless": 1.8, "happy": 2.5,
+    "glad": 2.0, "excited": 2.2, "exciting": 2.2, "thanks": 1.7, "thank": 1.7, "win": 2.2,
+    "wins": 2.2, "bullish": 2.0, "promising": 1.8, "recommend": 1.8, "works": 1.0, "best": 3.0,
+    "better": 1.9, "wow": 2.0, "finally": 0.8, "congrats": 2.4, "congratulations": 2.4,
+    "legit": 1.5, "solid": 1.6, "clean": 1.2, "perfect": 3.0, "game-changer": 2.8,
+    # negative
+    "hate": -3.0, "hated": -3.0, "awful": -3.0, "terrible": -3.0, "horrible": -3.0,
+    "worst": -3.0, "bad": -2.2, "worse": -2.3, "poor": -2.0, "slow": -1.5, "expensive": -1.6,
+    "broken": -2.2, "bug": -1.6, "buggy": -2.0, "fail": -2.2, "failed": -2.2, "fails": -2.2,
+    "scam": -3.0, "scammy": -2.8, "fraud": -3.0, "ponzi": -3.0, "rug": -2.5, "risky": -1.8,
+    "risk": -1.2, "volatile": -1.5, "volatility": -1.2, "useless": -2.5, "pointless": -2.0,
+    "confusing": -1.7, "complicated": -1.5, "annoying": -2.0, "disappointed": -2.3,
+    "disappointing": -2.3, "sucks": -2.5, "stupid": -2.3, "dumb": -2.0, "lost": -1.5,
+    "lose": -1.6, "losing": -1.6, "problem": -1.4, "problems": -1.4, "issue": -1.0,
+    "issues": -1.0, "delay": -1.3, "delayed": -1.4, "spam": -2.2, "shill": -2.0,
+    "bearish": -2.0, "hack": -2.0, "hacked": -2.8, "illegal": -2.5, "sketchy": -2.0,
+    "doubt": -1.4, "skeptical": -1.3, "meh": -0.8, "waste": -2.2,
+    # emoji and emoticons
+    ":)": 1.8, ":-)": 1.8, ":d": 2.2, ":(": -1.9, ":-(": -1.9,
+    "🚀": 2.0, "🔥": 1.8, "👍": 1.8, "❤️": 2.5, "❤": 2.5, "🙌": 2.0, "👏": 2.0, "😍": 2.8,
+    "😂": 1.0, "🙂": 1.2, "👎": -1.8, "😡": -2.8, "😠": -2.4, "🤮": -2.8, "💩": -2.2, "😞": -2.0,
+}
+SENTIMENT_NEGATIONS = frozenset("not no never isn't aren't wasn't weren't don't doesn't didn't can't cannot won't hardly nothing".split())
+SENTIMENT_BOOSTERS = {"very": 0.3, "really": 0.3, "so": 0.2, "extremely": 0.5, "super": 0.4,
+                      "totally": 0.3, "absolutely": 0.4, "incredibly": 0.4, "slightly": -0.3, "kinda": -0.3}
+_SENTIMENT_TOKEN_RE = re.compile(r":-?[()dD]|[a-z][a-z'\-]*|[\U0001F300-\U0001FAFF❤]️?", re.IGNORECASE)
+
+def score_sentiment_batch(texts):
+    """
+    Scores a batch of texts with the valence lexicon. Returns compound scores in
+    [-1, 1]; negations within three words flip a term, boosters scale it.
+    """
+    scores = []
+    for text in texts:
+        tokens = [token.lower() for token in _SENTIMENT_TOKEN_RE.findall(text or "")]
+        total = 0.0
+        for i, token in enumerate(tokens):
+            valence = SENTIMENT_LEXICON.get(token)
+            if valence is None:
+                continue
+            if i and tokens[i - 1] in SENTIMENT_BOOSTERS:
+                valence += math.copysign(SENTIMENT_BOOSTERS[tokens[i - 1]], valence)
+            if any(t in SENTIMENT_NEGATIONS for t in tokens[max(0, i - 3):i]):
+                valence *= -0.74
+            total += valence
+        if text and "!" in text:
+            total += math.copysign(min(text.count("!"), 4) * 0.29, total) if total else 0.0
+        scores.append(round(total / math.sqrt(total * total + 15), 4))
+    return scores
+
+def sentiment_label(score):
+    if score >= 0.05:
+        return "positive"
+    if score <= -0.05:
+        return "negative"
+    return "neutral"
+
+def _load_fixture_comments():
+    """
+    Reads the fixture file: {"twitter": {post_id: [comment...]}, "reddit": {...}} with
+    comments as {"id", "text", "created_at"}.
+    """
+    with open(SENTIMENT_FIXTURE, "r") as f:
+        return json.load(f)
+
+def _fetch_tweet_replies(tweet_id):
+    client = get_twitter_client()
+    comments, next_token = [], None
+    while len(comments) < SENTIMENT_MAX_COMMENTS:
+        response = client.search_recent_tweets(
+            query=f"conversation_id:{tweet_id} is:reply", tweet_fields=["created_at"],
+            max_results=100, next_token=next_token
+        )
+        for tweet in response.data or []:
+            created = tweet.created_at.strftime("%Y-%m-%d %H:%M:%S") if tweet.created_at else None
+            comments.append({"id": str(tweet.id), "text": tweet.text, "created_at": created})
+        next_token = (response.meta or {}).get("next_token")
+        if not next_token:
+            break
+    return comments[:SENTIMENT_MAX_COMMENTS]
+
+def _fetch_reddit_comments(submission_id):
+    submission = get_reddit_client().submission(id=submission_id.split("_", 1)[-1])
+    submission.comments.replace_more(limit=0)
+    return [
+        {"id": comment.id, "text": comment.body,
+         "created_at": datetime.fromtimestamp(comment.created_utc).strftime("%Y-%m-%d %H:%M:%S")}
+        for comment in submission.comments.list()[:SENTIMENT_MAX_COMMENTS]
+    ]
+
+def _our_posts():
+    """
+    Lists the (platform, post_id) of every post the outbox has delivered.
+    """
+    posting_engine.start()
+    with posting_engine.lock:
+        return [(target["platform"], target["remote_id"])
+                for entry in posting_engine.entries.values()
+                for target in entry["targets"] if target["status"] == "posted" and target.get("remote_id")]
+
+_sentiment_cache_lock = threading.Lock()
+
+def _load_sentiment_cache():
+    try:
+        with open(SENTIMENT_CACHE_FILE, "r") as f:
+            cache = json.load(f)
+        if cache.get("version") == SENTIMENT_LEXICON_VERSION:
+            return cache
+    except (FileNotFoundError, ValueError):
+        pass
+    return {"version": SENTIMENT_LEXICON_VERSION, "comments": {}}
+
+def _save_sentiment_cache(cache):
+    tmp_path = f"{SENTIMENT_CACHE_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, SENTIMENT_CACHE_FILE)
+
+def _sentiment_stats(scores):
+    labels = collections.Counter(sentiment_label(score) for score in scores)
+    return {
+        "comments": len(scores),
+        "mean_score": round(sum(scores) / len(scores), 4) if scores else None,
+        "positive": labels["positive"],
+        "neutral": labels["neutral"],
+        "negative": labels["negative"],
+    }
+
+def analyze_comment_sentiment(twitter_ids=None, reddit_ids=None):
+    """
+    Scores the comments on our tweets and Reddit submissions and aggregates them per
+    post and per day. Defaults to every post the outbox delivered (or every post in
+    the fixture when SENTIMENT_FIXTURE is set).
+    """
+    fixture = _load_fixture_comments() if SENTIMENT_FIXTURE else None
+    posts = [("twitter", str(i)) for i in twitter_ids or []] + [("reddit", str(i)) for i in reddit_ids or []]
+    if not posts:
+        if fixture is not None:
+            posts = [(platform, post_id) for platform in ("twitter", "reddit") for post_id in fixture.get(platform, {})]
+        else:
+            posts = _our_posts()
+    if not posts:
+        return {"status": "error", "message": "No posts to analyze. Pass post ids or cross-post something first."}
+
+    def fetch(post):
+        platform, post_id = post
+        if fixture is not None:
+            return fixture.get(platform, {}).get(post_id, [])
+        if platform == "twitter":
+            return _fetch_tweet_replies(post_id)
+        return _fetch_reddit_comments(post_id)
+
+    errors = []
+    comments_by_post = {}
+    with stage_timer("sentiment_fetch"), ThreadPoolExecutor(max_workers=min(4, len(posts))) as pool:
+        for post, future in zip(posts, [pool.submit(fetch, post) for post in posts]):
+            try:
+                comments_by_post[post] = future.result()
+            except Exception as e:
+                errors.append({"platform": post[0], "post_id": post[1], "error": str(e)})
+
+    with _sentiment_cache_lock:
+        cache = _load_sentiment_cache()
+        scored = cache["comments"]
+        pending = [(f"{platform}:{comment['id']}", platform, post_id, comment)
+                   for (platform, post_id), comments in comments_by_post.items()
+                   for comment in comments if f"{platform}:{comment['id']}" not in scored]
+        with stage_timer("sentiment_scoring"):
+            for start in range(0, len(pending), SENTIMENT_BATCH_SIZE):
+                batch = pending[start:start + SENTIMENT_BATCH_SIZE]
+                for (key, platform, post_id, comment), score in zip(batch, score_sentiment_batch([c[3].get("text") for c in batch])):
+                    scored[key] = {"post_id": post_id, "score": score, "created_at": comment.get("created_at")}
+        if pending:
+            _save_sentiment_cache(cache)
+
+    per_post = []
+    by_day = collections.defaultdict(list)
+    all_scores = []
+    for (platform, post_id), comments in comments_by_post.items():
+        scores = []
+        for comment in comments:
+            record = scored[f"{platform}:{comment['id']}"]
+            scores.append(record["score"])
+            by_day[(record["created_at"] or "unknown")[:10]].append(record["score"])
+        all_scores += scores
+        per_post.append(dict(_sentiment_stats(scores), platform=platform, post_id=post_id))
+
+    return {
+        "status": "success" if comments_by_post else "error",
+        "summary": dict(_sentiment_stats(all_scores), newly_scored=len(pending), cached=len(all_scores) - len(pending)),
+        "posts": sorted(per_post, key=lambda p: p["comments"], reverse=True),
+        "timeline": [dict(_sentiment_stats(by_day[day]), date=day) for day in sorted(by_day)],
+        "errors": errors
+    }
+
 # ----------------------
 # Function: Get Company Details
 # ----------------------
@@ -160,12 +1802,12 @@ def get_company_details(filename=None):
     file_path = os.path.join(DATA_DIR, filename)
     try:
         employees = []
-        with open(file_path, mode='r', newline='') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                row['salary'] = float(row.get('salary', 0))
-                row['work_hours'] = float(row.get('work_hours', 0))
-                employees.append(row)
+        rows = prefetched(("csv", file_path), cached_csv_rows, file_path)
+        for row in rows if rows is not None else iter_employee_csv(file_path):
+            row = dict(row)
+            row['salary'] = float(row.get('salary', 0))
+            row['work_hours'] = float(row.get('work_hours', 0))
+            employees.append(row)
         return {"status": "success", "data": employees}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -183,12 +1825,12 @@ def employee_analytics(filename=None):
     file_path = os.path.join(DATA_DIR, filename)
     try:
         employees = []
-        with open(file_path, mode='r', newline='') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                row['salary'] = float(row.get('salary', 0))
-                row['work_hours'] = float(row.get('work_hours', 0))
-                employees.append(row)
+        rows = prefetched(("csv", file_path), cached_csv_rows, file_path)
+        for row in rows if rows is not None else iter_employee_csv(file_path):
+            row = dict(row)
+            row['salary'] = float(row.get('salary', 0))
+            row['work_hours'] = float(row.get('work_hours', 0))
+            employees.append(row)
         if not employees:
             return {"status": "error", "message": "No employee data found."}
         
@@ -210,84 +1852,1041 @@ def employee_analytics(filename=None):
         return {"status": "error", "message": str(e)}
 
 # ----------------------
-# Utility: Log Bulk Transfer Transaction
+# Utility: Log Bulk Transfer Transaction
+# ----------------------
+# nonce and replaces (';'-separated hashes a mined transaction superseded) were added
+# for the stuck-transaction watchdog; older logs are upgraded in place on first write.
+TRANSFER_LOG_FIELDS = ['tx_hash', 'status', 'recipient', 'amount', 'timestamp', 'nonce', 'replaces']
+
+def _upgrade_transfer_log(log_csv_path):
+    """
+    Rewrites a log with an older header so its columns match TRANSFER_LOG_FIELDS.
+    """
+    with open(log_csv_path, mode='r', newline='') as file:
+        header = next(csv.reader(file), None)
+    if header is None or header == TRANSFER_LOG_FIELDS:
+        return
+    tmp_path = f"{log_csv_path}.tmp"
+    with open(log_csv_path, mode='r', newline='') as source, open(tmp_path, mode='w', newline='') as target:
+        writer = csv.DictWriter(target, fieldnames=TRANSFER_LOG_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(csv.DictReader(source))
+    os.replace(tmp_path, log_csv_path)
+
+def open_transfer_log(log_csv_path):
+    """
+    Opens the transaction log for appending, writing the header if the file is new.
+    Returns (file, writer); the caller is responsible for closing the file.
+    """
+    file_exists = os.path.exists(log_csv_path)
+    if file_exists:
+        _upgrade_transfer_log(log_csv_path)
+    file = open(log_csv_path, mode='a', newline='')
+    writer = csv.DictWriter(file, fieldnames=TRANSFER_LOG_FIELDS)
+    if not file_exists:
+        writer.writeheader()
+    return file, writer
+
+def log_bulk_transfer_transaction(log_csv_path, transaction_data):
+    """
+    Logs a transaction to a CSV file.
+    transaction_data: dict with keys: tx_hash, status, recipient, amount, timestamp
+    """
+    file, writer = open_transfer_log(log_csv_path)
+    with file:
+        writer.writerow(transaction_data)
+    return True
+
+# ----------------------
+# Roster Selectors
+# ----------------------
+# Transfer tools take compact selectors (company, department, status, ids, salary
+# override) instead of having the model serialize the whole roster as JSON. The
+# server resolves them against local roster data, so the model's output stays a few
+# dozen tokens regardless of headcount.
+COMPANIES_DIR = "All_Companies"
+ROSTER_SELECTOR_KEYS = ("company_id", "department", "status", "employee_ids", "salary_override")
+
+ROSTER_SELECTOR_PROPERTIES = {
+    "company_id": {"type": "string", "description": "Company folder under All_Companies; omit for the default employee roster"},
+    "department": {"type": "string", "description": "Only pay employees in this department"},
+    "status": {"type": "string", "description": "Only pay employees with this status; company rosters default to active, 'any' pays every status"},
+    "employee_ids": {"type": "array", "items": {"type": "string"}, "description": "Only pay these employee ids or emails"},
+    "salary_override": {
+        "type": "object",
+        "description": "Change the amounts paid: mode 'fixed' pays value to everyone, 'multiplier' scales salaries, 'add' adds value",
+        "properties": {
+            "mode": {"type": "string", "enum": ["fixed", "multiplier", "add"]},
+            "value": {"type": "number"}
+        },
+        "required": ["mode", "value"]
+    }
+}
+
+def roster_selectors(args):
+    """
+    Picks the roster selector arguments out of a function call's arguments.
+    """
+    return {key: args[key] for key in ROSTER_SELECTOR_KEYS if args.get(key) is not None}
+
+def _company_dir(company_id):
+    if not company_id or os.path.basename(company_id) != company_id or company_id.startswith("."):
+        raise ValueError(f"Invalid company id: {company_id}")
+    company_dir = os.path.join(COMPANIES_DIR, company_id)
+    if not os.path.isdir(company_dir):
+        raise ValueError(f"Unknown company: {company_id}")
+    return company_dir
+
+def _last_regular_payment(company_dir, employee_id):
+    """
+    Returns the most recent regular payment amount from an employee's payment history,
+    used as the salary for company rosters that don't store one.
+    """
+    path = os.path.join(company_dir, f"{employee_id}.csv")
+    latest_date, amount = None, None
+    try:
+        with open(path, mode='r', newline='') as file:
+            for row in csv.DictReader(file):
+                if row.get("type") == "regular" and (latest_date is None or row["date"] > latest_date):
+                    latest_date, amount = row["date"], row["amount"]
+    except FileNotFoundError:
+        pass
+    return amount
+
+def _iter_company_roster(company_id):
+    company_dir = _company_dir(company_id)
+    for row in iter_employee_csv(os.path.join(company_dir, f"{company_id}.csv")):
+        yield {
+            "id": row["employee_id"],
+            "accountId": row["wallet_address"],
+            "status": row.get("current_status"),
+            "department": row.get("department"),
+            "salary": row.get("salary") or _last_regular_payment(company_dir, row["employee_id"])
+        }
+
+def _apply_salary_override(salary, override):
+    mode, value = override["mode"], decimal.Decimal(str(override["value"]))
+    if mode == "fixed":
+        return value
+    if salary in (None, ""):
+        raise ValueError("no salary on record to adjust")
+    salary = decimal.Decimal(str(salary))
+    if mode == "multiplier":
+        return salary * value
+    if mode == "add":
+        return salary + value
+    raise ValueError(f"Unknown salary override mode: {mode}")
+
+def resolve_roster(company_id=None, department=None, status=None, employee_ids=None, salary_override=None):
+    """
+    Yields the employees matched by the selectors, one at a time, as rows with at
+    least id, accountId and salary. Rows without a status column count as active.
+    Company rosters carry ex-employees too, so they default to status "active";
+    status "any" turns the filter off.
+    """
+    if company_id:
+        rows = _iter_company_roster(company_id)
+        if status is None:
+            status = "active"
+    else:
+        rows = iter_employee_csv(os.path.join(DATA_DIR, DEFAULT_EMPLOYEE_CSV))
+    wanted_ids = {str(employee_id).lower() for employee_id in employee_ids} if employee_ids else None
+    if salary_override and salary_override.get("mode") not in ("fixed", "multiplier", "add"):
+        raise ValueError(f"Unknown salary override mode: {salary_override.get('mode')}")
+
+    for row in rows:
+        if department and (row.get("department") or "").lower() != department.lower():
+            continue
+        if status and status.lower() != "any" and (row.get("status") or "active").lower() != status.lower():
+            continue
+        if wanted_ids is not None and not {str(row.get("id", "")).lower(), (row.get("email") or "").lower()} & wanted_ids:
+            continue
+        if salary_override:
+            row = dict(row)
+            try:
+                row["salary"] = str(_apply_salary_override(row.get("salary"), salary_override))
+            except Exception as e:
+                # Leave the row for the validate stage to skip and report
+                row["salary"] = None
+                row["salary_error"] = str(e)
+        yield row
+
+# ----------------------
+# Nonce Manager (shared across threads and processes)
+# ----------------------
+# One NonceManager per (chain, sender) hands out nonces to every bulk transfer run,
+# so overlapping payrolls from the same account (two users, two gunicorn workers)
+# never reuse a nonce. State lives in a JSON file under an exclusive fcntl lock:
+# the next unreserved nonce, gaps left by reservations that were never broadcast
+# (handed out again first so later transactions don't stall), and leases of runs
+# still in flight. Every reservation resyncs with the chain to absorb drift.
+NONCE_STATE_DIR = os.path.join(DATA_DIR, "nonces")
+NONCE_BLOCK_SIZE = int(os.getenv("NONCE_BLOCK_SIZE", "64"))
+NONCE_LEASE_SECONDS = float(os.getenv("NONCE_LEASE_SECONDS", "1800"))
+# How long transaction counts primed by the speculative prefetch stay usable
+NONCE_PRIME_SECONDS = float(os.getenv("NONCE_PRIME_SECONDS", "10"))
+
+class NonceManager:
+    """
+    Allocates nonces for one sender on one chain, shared through a locked state file.
+    """
+    def __init__(self, w3, chain_id, sender):
+        self.w3 = w3
+        self.sender = sender
+        base = os.path.join(NONCE_STATE_DIR, f"{chain_id}_{sender.lower()}")
+        self.state_path = f"{base}.json"
+        self.lock_path = f"{base}.lock"
+        self.thread_lock = threading.Lock()
+        self.primed = None
+
+    @contextmanager
+    def _state(self):
+        """
+        Yields the state dict under the thread and file locks and writes it back.
+        """
+        with self.thread_lock:
+            os.makedirs(NONCE_STATE_DIR, exist_ok=True)
+            with open(self.lock_path, "a+") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    try:
+                        with open(self.state_path, "r") as f:
+                            state = json.load(f)
+                    except (FileNotFoundError, ValueError):
+                        state = {"next": None, "gaps": [], "leases": {}}
+                    yield state
+                    state["version"] = state.get("version", 0) + 1
+                    tmp_path = f"{self.state_path}.tmp"
+                    with open(tmp_path, "w") as f:
+                        json.dump(state, f)
+                    os.replace(tmp_path, self.state_path)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def version(self):
+        """
+        Returns the state file's write counter (state is replaced atomically, so this
+        needs no lock).
+        """
+        try:
+            with open(self.state_path, "r") as f:
+                return json.load(f).get("version", 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def prime(self, mined, pending, fetched_at, version):
+        """
+        Stores the sender's latest and pending transaction counts fetched ahead of a
+        run, so the next resync can skip both lookups. fetched_at is taken before the
+        lookups and version (see version()) before them too.
+        """
+        self.primed = (mined, pending, fetched_at, version)
+
+    def _primed_counts(self, state):
+        """
+        Returns the primed counts once, if they are recent and no reservation or
+        release has been written since before they were fetched.
+        """
+        primed, self.primed = self.primed, None
+        if primed is None or time.time() - primed[2] > NONCE_PRIME_SECONDS:
+            return None
+        if state.get("version", 0) != primed[3]:
+            return None
+        return primed[:2]
+
+    def _resync(self, state):
+        """
+        Reconciles the stored state with the chain: drops gaps that have been mined,
+        jumps ahead if the account was used elsewhere, and falls back to the chain's
+        nonce when nothing of ours is in flight (dropped transactions). Primed counts
+        may be slightly old, so they never lower the next nonce.
+        """
+        counts = self._primed_counts(state)
+        if counts is not None:
+            mined, pending = counts
+        else:
+            with stage_timer("nonce_lookup"):
+                mined = self.w3.eth.get_transaction_count(self.sender, "latest")
+                pending = self.w3.eth.get_transaction_count(self.sender, "pending")
+        now = time.time()
+        state["leases"] = {lease: expires for lease, expires in state["leases"].items() if expires > now}
+        state["gaps"] = sorted(gap for gap in set(state["gaps"]) if gap >= mined)
+        if state["next"] is None or pending > state["next"]:
+            state["next"] = pending
+        elif pending < state["next"] and not state["leases"] and counts is None:
+            state["next"] = pending
+        state["gaps"] = [gap for gap in state["gaps"] if gap < state["next"]]
+
+    def reserve(self, count, lease_id):
+        """
+        Reserves count nonces for a run, reusing gaps first, then a contiguous range.
+        """
+        with self._state() as state:
+            self._resync(state)
+            nonces = state["gaps"][:count]
+            state["gaps"] = state["gaps"][count:]
+            remaining = count - len(nonces)
+            nonces += list(range(state["next"], state["next"] + remaining))
+            state["next"] += remaining
+            state["leases"][lease_id] = time.time() + NONCE_LEASE_SECONDS
+        return nonces
+
+    def claim(self, first, last, lease_id):
+        """
+        Claims the exact range first..last for a pre-signed plan. Fails if another run
+        has taken any of it or a gap below it would stall the plan.
+        """
+        with self._state() as state:
+            self._resync(state)
+            gaps = set(state["gaps"])
+            taken = {nonce for nonce in range(first, last + 1) if nonce < state["next"]}
+            if any(gap < first for gap in gaps) or not taken <= gaps:
+                return False
+            state["gaps"] = sorted(gaps - taken)
+            state["next"] = max(state["next"], last + 1)
+            state["leases"][lease_id] = time.time() + NONCE_LEASE_SECONDS
+        return True
+
+    def peek(self):
+        """
+        Returns the next nonce a new reservation would start from, or None if there
+        are gaps waiting to be filled first.
+        """
+        with self._state() as state:
+            self._resync(state)
+            return None if state["gaps"] else state["next"]
+
+    def release(self, nonces, lease_id):
+        """
+        Returns reserved nonces that were never broadcast and ends the run's lease.
+        Released nonces at the top of the range simply lower the next nonce.
+        """
+        with self._state() as state:
+            if state["next"] is None:
+                # Nothing was ever reserved through this state file
+                state["leases"].pop(lease_id, None)
+                return
+            gaps = set(state["gaps"]) | {nonce for nonce in nonces if nonce < state["next"]}
+            while state["next"] - 1 in gaps:
+                state["next"] -= 1
+                gaps.discard(state["next"])
+            state["gaps"] = sorted(gaps)
+            state["leases"].pop(lease_id, None)
+
+_nonce_managers = {}
+_nonce_managers_lock = threading.Lock()
+
+def get_nonce_manager(w3, chain_id, sender):
+    """
+    Returns the process-wide NonceManager for (chain_id, sender).
+    """
+    key = (chain_id, sender.lower())
+    with _nonce_managers_lock:
+        manager = _nonce_managers.get(key)
+        if manager is None:
+            manager = _nonce_managers[key] = NonceManager(w3, chain_id, sender)
+        manager.w3 = w3
+        return manager
+
+# ----------------------
+# Bulk Transfer Pipeline (streaming, bounded memory)
+# ----------------------
+# Every bulk transfer runs as read -> validate -> build tx -> sign -> broadcast -> log.
+# Each stage after the reader runs in its own thread and the stages are connected by
+# bounded queues, so memory stays flat for any roster size and the first transaction
+# is broadcast as soon as the first row has been read.
+TRANSFER_QUEUE_SIZE = int(os.getenv("TRANSFER_QUEUE_SIZE", "256"))
+TRANSFER_RECEIPT_SAMPLE = int(os.getenv("TRANSFER_RECEIPT_SAMPLE", "100"))
+SONIC_RPC_URL = os.getenv("SONIC_RPC_URL", "https://rpc.blaze.soniclabs.com/")
+TRANSFER_GAS_LIMIT = 21000
+TRANSFER_MAX_PRIORITY_FEE_GWEI = "2"
+TRANSFER_MAX_FEE_GWEI = "50"
+
+# Stuck-transaction watchdog: a transaction pending longer than the timeout is
+# re-signed at the same nonce with fees raised by STUCK_TX_FEE_BUMP (nodes require
+# at least +10% to accept a replacement), never above STUCK_TX_MAX_FEE_GWEI.
+STUCK_TX_TIMEOUT_SECONDS = float(os.getenv("STUCK_TX_TIMEOUT_SECONDS", "120"))
+STUCK_TX_FEE_BUMP = float(os.getenv("STUCK_TX_FEE_BUMP", "1.125"))
+STUCK_TX_MAX_FEE_GWEI = os.getenv("STUCK_TX_MAX_FEE_GWEI", "500")
+RECEIPT_POLL_SECONDS = float(os.getenv("RECEIPT_POLL_SECONDS", "1"))
+# Consecutive failed receipt lookups (node errors, not "not found yet") tolerated
+# before a transaction is logged with status "unknown" for reconciliation to settle
+RECEIPT_LOOKUP_RETRIES = int(os.getenv("RECEIPT_LOOKUP_RETRIES", "5"))
+
+_PIPELINE_DONE = object()
+
+def to_hex(value):
+    """
+    Hex-encodes hashes and raw transactions with a 0x prefix regardless of the
+    hexbytes version in use.
+    """
+    text = value.hex()
+    return text if text.startswith("0x") else f"0x{text}"
+
+def iter_employee_csv(file_path):
+    """
+    Yields employee rows from a CSV file one at a time, from the parsed-roster cache
+    if a prefetch or an earlier request has already read the file.
+    """
+    rows = prefetched(("csv", file_path), warm_csv_rows, file_path)
+    if rows is not None:
+        for row in rows:
+            yield dict(row)
+        return
+    with open(file_path, mode='r', newline='') as file:
+        for row in csv.DictReader(file):
+            yield row
+
+def iter_employees_json(employees_json):
+    """
+    Yields employees from a JSON array string one element at a time, without
+    materializing the whole list. Already-decoded lists are passed through.
+    """
+    if not isinstance(employees_json, str):
+        yield from employees_json
+        return
+
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r"\s*")
+    text = employees_json
+    idx = whitespace.match(text, 0).end()
+    if text[idx:idx + 1] != "[":
+        raise ValueError("employees_json must be a JSON array")
+    idx += 1
+    while True:
+        idx = whitespace.match(text, idx).end()
+        if text[idx:idx + 1] == "]":
+            return
+        employee, idx = decoder.raw_decode(text, idx)
+        yield employee
+        idx = whitespace.match(text, idx).end()
+        if text[idx:idx + 1] == ",":
+            idx += 1
+        elif text[idx:idx + 1] != "]":
+            raise ValueError(f"Malformed employees_json at position {idx}")
+
+def _pipeline_put(q, item, stop):
+    """
+    Puts an item on a bounded queue, giving up if the pipeline has been stopped.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _pipeline_worker(fn, inbox, outbox, stop, errors, drain=False, drain_outbox=False):
+    """
+    Runs one pipeline stage: applies fn to every item from inbox and forwards
+    non-None results to outbox. A raised exception stops the whole pipeline.
+    A draining stage keeps processing until its input is done even after a stop,
+    and results bound for a draining stage are always delivered, so nothing that
+    reached it (e.g. a broadcast transaction) is dropped.
+    """
+    while True:
+        try:
+            item = inbox.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set() and not drain:
+                break
+            continue
+        if item is _PIPELINE_DONE or (stop.is_set() and not drain):
+            break
+        try:
+            result = fn(item)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+            if drain:
+                continue
+            break
+        if result is not None and outbox is not None:
+            if drain_outbox:
+                outbox.put(result)
+            elif not _pipeline_put(outbox, result, stop):
+                break
+    if outbox is not None:
+        if drain_outbox:
+            outbox.put(_PIPELINE_DONE)
+        else:
+            _pipeline_put(outbox, _PIPELINE_DONE, stop)
+
+def run_pipeline(source, stages, queue_size=None, drain_from=None):
+    """
+    Feeds items from the source iterable through the stage functions, each in its
+    own thread with a bounded queue in front of it. Stages from index drain_from on
+    drain everything they are handed even after a failure. Returns the list of
+    exceptions that stopped the pipeline (empty on success).
+    """
+    queue_size = queue_size or TRANSFER_QUEUE_SIZE
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    threads = []
+    if drain_from is None:
+        drain_from = len(stages)
+    for i, fn in enumerate(stages):
+        outbox = queues[i + 1] if i + 1 < len(stages) else None
+        thread = threading.Thread(target=_pipeline_worker,
+                                  args=(fn, queues[i], outbox, stop, errors, i >= drain_from, i + 1 >= drain_from),
+                                  name=f"pipeline-{getattr(fn, '__name__', i)}", daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    try:
+        for item in source:
+            if not _pipeline_put(queues[0], item, stop):
+                break
+        else:
+            _pipeline_put(queues[0], _PIPELINE_DONE, stop)
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+
+    for thread in threads:
+        thread.join()
+    return errors
+
+class BulkTransfer:
+    """
+    State shared by the stages of one bulk transfer run: chain parameters, nonces
+    reserved from the shared NonceManager and the running summary. Each stage method
+    runs in its own pipeline thread.
+    """
+    def __init__(self, w3, private_key=None, log_csv_path=None):
+        self.w3 = w3
+        self.private_key = private_key
+        self.account = w3.eth.account.from_key(private_key) if private_key else None
+        self.log_csv_path = log_csv_path
+        # Stage threads don't see the request's thread-local state, so capture it here
+        self.timings = current_timings()
+        self.chain_id = None
+        self.nonce = None
+        self.nonce_manager = None
+        self.lease_id = None
+        self.reserved = collections.deque()
+        self.reserve_size = 1
+        self.unsent = set()
+        self.stalled_nonce = None
+        self.max_priority_fee = w3.to_wei(TRANSFER_MAX_PRIORITY_FEE_GWEI, "gwei")
+        self.max_fee = w3.to_wei(TRANSFER_MAX_FEE_GWEI, "gwei")
+        self.summary = {"sent": 0, "succeeded": 0, "failed": 0, "stuck": 0, "unknown": 0, "skipped": 0, "total_wei": 0}
+        self.receipts = []
+        self.skipped = []
+        self.log_file = None
+        self.log_writer = None
+        self.queue_size = None
+        # First broadcast failure; stops the run but the transaction is still logged
+        self.halt = None
+        # Rows read but not yet logged or skipped, by employee id
+        self.pending = collections.Counter()
+
+    def prepare(self, planning=False):
+        """
+        Looks up the chain id once for the whole run and attaches the sender's shared
+        NonceManager. A planning run only peeks at the next nonce; the range is claimed
+        when the plan is executed.
+        """
+        endpoint = getattr(self.w3.provider, "endpoint_uri", None)
+        with stage_timer("nonce_lookup", self.timings):
+            self.chain_id = prefetched(("chain_id", endpoint), lambda: self.w3.eth.chain_id)
+        self.nonce_manager = get_nonce_manager(self.w3, self.chain_id, self.account.address)
+        if planning:
+            self.nonce = self.nonce_manager.peek()
+            if self.nonce is None:
+                raise RuntimeError("Another run left nonce gaps for this sender; retry once it has finished")
+        else:
+            self.lease_id = uuid.uuid4().hex
+
+    def _take_nonce(self):
+        if self.lease_id is None:
+            nonce = self.nonce
+            self.nonce += 1
+            return nonce
+        if not self.reserved:
+            # Grow reservations geometrically so a short run leaves few unused nonces
+            self.reserved.extend(self.nonce_manager.reserve(self.reserve_size, self.lease_id))
+            self.reserve_size = min(self.reserve_size * 2, NONCE_BLOCK_SIZE)
+        nonce = self.reserved.popleft()
+        self.unsent.add(nonce)
+        return nonce
+
+    def adopt_nonces(self, nonce_manager, lease_id, nonces):
+        """
+        Takes over nonces already claimed elsewhere (a pre-signed plan) so the unsent
+        ones are released if the run stops early.
+        """
+        self.nonce_manager = nonce_manager
+        self.lease_id = lease_id
+        self.unsent = set(nonces)
+
+    def release_nonces(self):
+        """
+        Hands reserved-but-unbroadcast nonces back to the NonceManager as gaps.
+        """
+        if self.nonce_manager is not None and self.lease_id is not None:
+            self.nonce_manager.release(list(self.reserved) + list(self.unsent), self.lease_id)
+            self.reserved.clear()
+            self.unsent.clear()
+
+    def read(self, rows):
+        rows = iter(rows)
+        while True:
+            with stage_timer("roster_read", self.timings):
+                emp = next(rows, None)
+            if emp is None:
+                return
+            self.pending[_row_key(emp)] += 1
+            yield emp
+
+    def _finish(self, key):
+        self.pending[key] -= 1
+        if self.pending[key] <= 0:
+            del self.pending[key]
+
+    def unprocessed(self):
+        """
+        Returns the ids of rows this run read but never logged or skipped.
+        """
+        return [key for key, count in self.pending.items() for _ in range(count)]
+
+    def validate(self, emp):
+        try:
+            if emp.get("salary") in (None, ""):
+                raise ValueError(emp.get("salary_error") or "no salary on record")
+            recipient = self.w3.to_checksum_address(emp["accountId"])
+            value = self.w3.to_wei(str(emp["salary"]), "ether")
+            if value <= 0:
+                raise ValueError("salary must be positive")
+            return {"to": recipient, "value": value, "employee": _row_key(emp)}
+        except Exception as e:
+            self._finish(_row_key(emp))
+            self.summary["skipped"] += 1
+            if len(self.skipped) < TRANSFER_RECEIPT_SAMPLE:
+                self.skipped.append({"employee": _row_key(emp), "reason": str(e)})
+            return None
+
+    def build(self, payment):
+        tx = {
+            "to": payment["to"],
+            "value": payment["value"],
+            "nonce": self._take_nonce(),
+            "gas": TRANSFER_GAS_LIMIT,
+            "maxPriorityFeePerGas": self.max_priority_fee,
+            "maxFeePerGas": self.max_fee,
+            "chainId": self.chain_id
+        }
+        return {"tx": tx, "employee": payment.get("employee")}
+
+    def sign(self, built):
+        with stage_timer("sign", self.timings):
+            signed_tx = self.w3.eth.account.sign_transaction(built["tx"], self.private_key)
+        built["raw"] = signed_tx.raw_transaction
+        built["hash"] = signed_tx.hash
+        return built
+
+    def broadcast(self, signed):
+        if self.halt is not None:
+            raise self.halt
+        try:
+            with stage_timer("broadcast", self.timings):
+                signed["hash"] = self.w3.eth.send_raw_transaction(signed["raw"])
+        except Exception as e:
+            # The node may have accepted it anyway: keep the nonce, log the signed
+            # hash as "unknown" and stop handing out new transactions
+            print(f"Broadcast of nonce {signed['tx']['nonce']} failed: {e}")
+            self.halt = e
+            signed["broadcast_error"] = str(e)
+        self.unsent.discard(signed["tx"]["nonce"])
+        if "broadcast_error" not in signed:
+            self.summary["sent"] += 1
+        return signed
+
+    def _bump_fees(self, tx):
+        """
+        Returns a copy of tx with EIP-1559 fees raised enough to replace it in the
+        mempool, or None if that would exceed the configured fee ceiling.
+        """
+        ceiling = self.w3.to_wei(STUCK_TX_MAX_FEE_GWEI, "gwei")
+        priority_fee = max(int(tx["maxPriorityFeePerGas"] * STUCK_TX_FEE_BUMP), tx["maxPriorityFeePerGas"] + 1)
+        max_fee = max(int(tx["maxFeePerGas"] * STUCK_TX_FEE_BUMP), tx["maxFeePerGas"] + 1)
+        try:
+            base_fee = self.w3.eth.get_block("latest").get("baseFeePerGas") or 0
+            max_fee = max(max_fee, 2 * base_fee + priority_fee)
+        except Exception:
+            pass
+        if max_fee > ceiling:
+            # Use whatever headroom is left below the ceiling, if it is still a valid bump
+            max_fee = ceiling
+            if max_fee < tx["maxFeePerGas"] * STUCK_TX_FEE_BUMP or priority_fee > max_fee:
+                return None
+        return dict(tx, maxPriorityFeePerGas=priority_fee, maxFeePerGas=max_fee)
+
+    def _predecessor_pending(self, nonce):
+        """
+        True if an earlier nonce of the sender (from any run) is not mined yet.
+        """
+        try:
+            return self.w3.eth.get_transaction_count(self.account.address, "latest") < nonce
+        except Exception as e:
+            print(f"Could not check the mined nonce of {self.account.address}: {e}")
+            return True
+
+    def _await_receipt(self, sent):
+        """
+        Polls for the receipt of a broadcast transaction. If it stays pending past
+        STUCK_TX_TIMEOUT_SECONDS it is re-signed at the same nonce with bumped fees and
+        rebroadcast, up to the fee ceiling; after that it is given up on as stuck, and
+        later nonces (which cannot be mined before it) are only checked once.
+        The timeout runs from when this stage starts waiting on the nonce, i.e. once
+        the previous one has settled, not from the broadcast: nonces queued behind a
+        slow one would otherwise all be bumped at once. A nonce whose predecessor is
+        still pending is never bumped; after a second timeout it is given up on.
+        Returns (receipt or None, mined hash, superseded hashes).
+        """
+        from web3.exceptions import TransactionNotFound
+
+        tx = sent["tx"]
+        hashes = sent["hashes"] = [sent["hash"]]
+        deadline = time.monotonic() + STUCK_TX_TIMEOUT_SECONDS
+        can_bump = self.private_key is not None and "maxFeePerGas" in tx
+        lookup_errors = 0
+        blocked = False
+        while True:
+            try:
+                for tx_hash in reversed(hashes):
+                    try:
+                        receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+                    except TransactionNotFound:
+                        continue
+                    return receipt, tx_hash, [h for h in hashes if h != tx_hash]
+                lookup_errors = 0
+            except Exception as e:
+                # Transient node trouble: back off and ask again, up to a limit
+                lookup_errors += 1
+                if lookup_errors > RECEIPT_LOOKUP_RETRIES:
+                    raise
+                print(f"Receipt lookup for nonce {tx['nonce']} failed ({lookup_errors}/{RECEIPT_LOOKUP_RETRIES}): {e}")
+                time.sleep(RECEIPT_POLL_SECONDS * lookup_errors)
+                continue
+
+            if self.stalled_nonce is not None and tx["nonce"] > self.stalled_nonce:
+                return None, hashes[-1], hashes[:-1]
+            if time.monotonic() >= deadline:
+                if can_bump and self._predecessor_pending(tx["nonce"]):
+                    # It can't be mined before the earlier nonce; bumping it would be wasted
+                    if blocked:
+                        self.stalled_nonce = tx["nonce"]
+                        return None, hashes[-1], hashes[:-1]
+                    blocked = True
+                    deadline = time.monotonic() + STUCK_TX_TIMEOUT_SECONDS
+                    time.sleep(RECEIPT_POLL_SECONDS)
+                    continue
+                replacement = self._bump_fees(tx) if can_bump else None
+                if replacement is None:
+                    self.stalled_nonce = tx["nonce"]
+                    return None, hashes[-1], hashes[:-1]
+                try:
+                    signed_tx = self.w3.eth.account.sign_transaction(replacement, self.private_key)
+                    hashes.append(self.w3.eth.send_raw_transaction(signed_tx.raw_transaction))
+                    tx = replacement
+                    metrics.inc("payzoll_tx_replacements_total")
+                    print(f"Nonce {tx['nonce']} stuck; rebroadcast with maxFeePerGas {tx['maxFeePerGas']}")
+                except Exception as e:
+                    # e.g. the original was mined meanwhile ("nonce too low"); keep polling
+                    print(f"Fee bump for nonce {tx['nonce']} failed: {e}")
+                    tx = replacement
+                deadline = time.monotonic() + STUCK_TX_TIMEOUT_SECONDS
+            time.sleep(RECEIPT_POLL_SECONDS)
+
+    def log(self, sent):
+        """
+        Waits for the receipt and logs the transaction. Every transaction that reaches
+        this stage is logged: if its broadcast failed or its receipt can't be fetched
+        it is logged as "unknown" so a rerun won't pay it again blindly.
+        """
+        tx = sent["tx"]
+        receipt, tx_hash, replaced = None, sent["hash"], []
+        if "broadcast_error" in sent:
+            status = "unknown"
+        else:
+            try:
+                with stage_timer("receipt_wait", self.timings):
+                    receipt, tx_hash, replaced = self._await_receipt(sent)
+                status = "stuck" if receipt is None else receipt.status
+            except Exception as e:
+                print(f"Giving up on the receipt for nonce {tx['nonce']}: {e}")
+                hashes = sent.get("hashes") or [tx_hash]
+                tx_hash, replaced, status = hashes[-1], hashes[:-1], "unknown"
+        if status == 1:
+            self.summary["succeeded"] += 1
+            self.summary["total_wei"] += tx["value"]
+            metrics.inc("payzoll_transfers_total", {"status": "succeeded"})
+        elif status in ("stuck", "unknown"):
+            self.summary[status] += 1
+            metrics.inc("payzoll_transfers_total", {"status": status})
+        else:
+            self.summary["failed"] += 1
+            metrics.inc("payzoll_transfers_total", {"status": "failed"})
+        if len(self.receipts) < TRANSFER_RECEIPT_SAMPLE:
+            self.receipts.append({"tx_hash": to_hex(tx_hash), "status": status})
+        with stage_timer("log_write", self.timings):
+            self.log_writer.writerow({
+                "tx_hash": to_hex(tx_hash),
+                "status": status,
+                "recipient": tx["to"],
+                "amount": tx["value"],
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "nonce": tx["nonce"],
+                "replaces": ";".join(to_hex(h) for h in replaced)
+            })
+            self.log_file.flush()
+        self._finish(sent.get("employee"))
+
+    def run(self, source, stages):
+        """
+        Runs the given stages over source with the transaction log open. Returns the
+        pipeline errors.
+        """
+        self.log_file, self.log_writer = open_transfer_log(self.log_csv_path)
+        # Everything from the broadcast on is drained, so sent transactions are always logged
+        drain_from = next((i for i, stage in enumerate(stages) if stage == self.log), None)
+        try:
+            with self.log_file:
+                errors = run_pipeline(source, stages, self.queue_size, drain_from)
+        finally:
+            self.release_nonces()
+        if self.halt is not None and self.halt not in errors:
+            errors.append(self.halt)
+        return errors
+
+    def result(self, errors):
+        self.summary["truncated"] = self.summary["sent"] > len(self.receipts)
+        result = {"data": self.receipts, "summary": self.summary}
+        if self.skipped:
+            result["skipped"] = self.skipped
+        if errors:
+            result.update({"status": "error", "message": f"Error in bulk transfer: {errors[0]}"})
+        else:
+            result["status"] = "success"
+        if self.summary["unknown"]:
+            result["warning"] = (f"{self.summary['unknown']} transactions have an unknown outcome; "
+                                 "run reconcile_transfer_log before paying anyone again")
+        return result
+
+def _row_key(emp):
+    return emp.get("id") or emp.get("accountId")
+
+def stream_bulk_transfer(w3, private_key, employees, log_csv_path):
+    """
+    Streams employees through the transfer pipeline and logs every transaction.
+    Invalid rows are skipped and reported instead of aborting the run.
+    """
+    run = BulkTransfer(w3, private_key, log_csv_path)
+    run.prepare()
+    errors = run.run(run.read(employees), [run.validate, run.build, run.sign, run.broadcast, run.log])
+    return run.result(errors)
+
+# ----------------------
+# Sender Pool (parallel nonce lanes)
 # ----------------------
-def log_bulk_transfer_transaction(log_csv_path, transaction_data):
+# With SENDER_PRIVATE_KEYS (comma-separated) or SENDER_MNEMONIC (+ SENDER_COUNT, HD
+# path m/44'/60'/0'/0/i) payroll goes out from several funded accounts at once. Each
+# sender is a lane with its own nonce sequence and pipeline; lanes pull recipients
+# from one shared roster iterator, so a slow or stuck lane simply takes fewer rows.
+# Before a run the pool is rebalanced: accounts above the average balance top up the
+# ones more than SENDER_TOPUP_TOLERANCE below it. Without a pool, PRIVATE_KEY is used.
+SENDER_COUNT = int(os.getenv("SENDER_COUNT", "4"))
+SENDER_HD_PATH = "m/44'/60'/0'/0/{index}"
+SENDER_TOPUP_TOLERANCE = float(os.getenv("SENDER_TOPUP_TOLERANCE", "0.1"))
+SENDER_TOPUP_LOG = "sender_topups.csv"
+# Rows a lane may hold between stages; small so one lane can't take the whole roster
+SENDER_LANE_QUEUE_SIZE = int(os.getenv("SENDER_LANE_QUEUE_SIZE", "4"))
+# (configuration, keys) of the last derived pool
+_sender_pool = (None, None)
+_sender_pool_lock = threading.Lock()
+
+def sender_pool_keys():
     """
-    Logs a transaction to a CSV file.
-    transaction_data: dict with keys: tx_hash, status, recipient, amount, timestamp
+    Returns the private keys of the configured sender pool, or [PRIVATE_KEY].
+    Deriving HD keys is slow (key stretching per key), so the pool is derived once
+    and reused until its configuration changes.
     """
-    file_exists = os.path.exists(log_csv_path)
-    with open(log_csv_path, mode='a', newline='') as file:
-        fieldnames = ['tx_hash', 'status', 'recipient', 'amount', 'timestamp']
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(transaction_data)
-    return True
+    global _sender_pool
+    config = (os.getenv("SENDER_PRIVATE_KEYS", ""), os.getenv("SENDER_MNEMONIC"), SENDER_COUNT, os.getenv("PRIVATE_KEY"))
+    with _sender_pool_lock:
+        if _sender_pool[0] != config:
+            keys = [key.strip() for key in config[0].split(",") if key.strip()]
+            mnemonic = config[1]
+            if not keys and mnemonic:
+                from eth_account import Account
+
+                Account.enable_unaudited_hdwallet_features()
+                keys = [Account.from_mnemonic(mnemonic, account_path=SENDER_HD_PATH.format(index=i)).key.hex()
+                        for i in range(SENDER_COUNT)]
+            _sender_pool = (config, keys or [config[3]])
+        return list(_sender_pool[1])
+
+class SharedRoster:
+    """
+    Thread-safe iterator over one roster, shared by every lane of a pooled run.
+    Once closed it hands out no more rows.
+    """
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.lock:
+            if self.closed:
+                raise StopIteration
+            return next(self.rows)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+
+def rebalance_sender_pool(w3, private_keys, log_csv_path=None):
+    """
+    Moves funds from senders above the pool's average balance to those more than
+    SENDER_TOPUP_TOLERANCE below it, waiting for the top-ups to be mined.
+    Returns the list of top-ups made.
+    """
+    accounts = [w3.eth.account.from_key(key) for key in private_keys]
+    balances = {account.address: w3.eth.get_balance(account.address) for account in accounts}
+    # Every top-up costs its sender gas, so keep that out of what can be moved
+    gas_reserve = TRANSFER_GAS_LIMIT * w3.to_wei(TRANSFER_MAX_FEE_GWEI, "gwei")
+    target = sum(balances.values()) // len(accounts)
+    deficits = {address: target - balance for address, balance in balances.items()
+                if target - balance > target * SENDER_TOPUP_TOLERANCE}
+    if not deficits:
+        return []
+
+    if log_csv_path is None:
+        log_csv_path = os.path.join(DATA_DIR, SENDER_TOPUP_LOG)
+    top_ups = []
+    for account, key in sorted(zip(accounts, private_keys), key=lambda pair: -balances[pair[0].address]):
+        surplus = balances[account.address] - target - gas_reserve * (len(deficits) + 1)
+        payments = []
+        for address in list(deficits):
+            if surplus <= 0:
+                break
+            amount = min(surplus, deficits[address])
+            payments.append({"id": f"top-up:{address}", "accountId": address, "salary": str(w3.from_wei(amount, "ether"))})
+            surplus -= amount
+            deficits[address] -= amount
+            if deficits[address] <= target * SENDER_TOPUP_TOLERANCE:
+                del deficits[address]
+        if payments:
+            result = stream_bulk_transfer(w3, key, payments, log_csv_path)
+            top_ups.append({"from": account.address, "payments": len(payments), "summary": result["summary"]})
+            if result["status"] == "error":
+                raise RuntimeError(f"Sender pool top-up failed: {result['message']}")
+        if not deficits:
+            break
+    return top_ups
+
+def pooled_bulk_transfer(w3, private_keys, employees, log_csv_path, rebalance=True):
+    """
+    Streams employees through one transfer pipeline per sender in parallel and logs
+    every transaction. With a single key this is stream_bulk_transfer.
+    """
+    if len(private_keys) == 1:
+        return stream_bulk_transfer(w3, private_keys[0], employees, log_csv_path)
+
+    top_ups = []
+    if rebalance:
+        with stage_timer("sender_rebalance"):
+            top_ups = rebalance_sender_pool(w3, private_keys)
+
+    roster = SharedRoster(employees)
+    lanes = [BulkTransfer(w3, key, log_csv_path) for key in private_keys]
+    for lane in lanes:
+        lane.prepare()
+        lane.queue_size = SENDER_LANE_QUEUE_SIZE
+    # Create the log (and its header) once before the lanes start appending to it
+    log_file, _ = open_transfer_log(log_csv_path)
+    log_file.close()
+
+    def guarded(lane, fn):
+        # The first failure in any lane stops the roster, so no lane pulls rows it won't send
+        @functools.wraps(fn)
+        def stage(item):
+            try:
+                result = fn(item)
+            except Exception:
+                roster.close()
+                raise
+            if lane.halt is not None:
+                roster.close()
+            return result
+        return stage
+
+    def run_lane(lane):
+        stages = [guarded(lane, fn) for fn in (lane.validate, lane.build, lane.sign, lane.broadcast)]
+        # log stays unwrapped: BulkTransfer.run finds the draining stage by identity
+        return lane.run(lane.read(roster), stages + [lane.log])
+
+    with ThreadPoolExecutor(max_workers=len(lanes), thread_name_prefix="lane") as pool:
+        lane_errors = list(pool.map(run_lane, lanes))
+
+    summary = {key: sum(lane.summary[key] for lane in lanes) for key in lanes[0].summary}
+    receipts = [receipt for lane in lanes for receipt in lane.receipts][:TRANSFER_RECEIPT_SAMPLE]
+    skipped = [item for lane in lanes for item in lane.skipped][:TRANSFER_RECEIPT_SAMPLE]
+    summary["truncated"] = summary["sent"] > len(receipts)
+    result = {
+        "data": receipts,
+        "summary": summary,
+        "lanes": [dict(lane.summary, sender=lane.account.address) for lane in lanes],
+    }
+    if summary["unknown"]:
+        result["warning"] = (f"{summary['unknown']} transactions have an unknown outcome; "
+                             "run reconcile_transfer_log before paying anyone again")
+    if top_ups:
+        result["top_ups"] = top_ups
+    if skipped:
+        result["skipped"] = skipped
+    errors = [error for errors in lane_errors for error in errors]
+    if errors:
+        result.update({"status": "error", "message": f"Error in bulk transfer: {errors[0]}"})
+        # Rows a lane had pulled but dropped when the run stopped; rows after them were never read
+        result["unprocessed"] = [key for lane in lanes for key in lane.unprocessed()]
+    else:
+        result["status"] = "success"
+    return result
 
 # ----------------------
 # Function: Complete Bulk Transfer with Logging
 # ----------------------
-def complete_bulk_transfer(log_filename=None):
+def complete_bulk_transfer(log_filename=None, roster=None):
     """
     Executes bulk transfers and logs each transaction to a local CSV file.
+    roster: optional selectors (see resolve_roster); defaults to every employee.
     """
     print("Complete Bulk Transfer")
     if log_filename is None:
         log_filename = DEFAULT_TRANSACTION_LOG
-        
+
     log_csv_path = os.path.join(DATA_DIR, log_filename)
 
     try:
-        w3 = Web3(Web3.HTTPProvider("https://rpc.blaze.soniclabs.com/"))
-        if not w3.is_connected():
+        with stage_timer("rpc_connect"):
+            w3, connected = prefetched(("web3", SONIC_RPC_URL), connect_checked, SONIC_RPC_URL)
+        if not connected:
             return {"status": "error", "message": "Could not connect to Ethereum node"}
-        
-        PRIVATE_KEY = os.getenv("PRIVATE_KEY")
-        account = w3.eth.account.from_key(PRIVATE_KEY)
-        sender_address = account.address
 
-        # Read employee data from CSV file
-        file_path = os.path.join(DATA_DIR, DEFAULT_EMPLOYEE_CSV)
-        employees = []
-        with open(file_path, mode='r', newline='') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                employees.append(row)
-
-        recipients = [emp["accountId"] for emp in employees]
-        values = [w3.to_wei(str(emp["salary"]), "ether") for emp in employees]
-
-        nonce = w3.eth.get_transaction_count(sender_address, "pending")
-        receipts = []
-        for i in range(len(recipients)):
-            tx = {
-                "to": recipients[i],
-                "value": values[i],
-                "nonce": nonce,
-                "gas": 21000,
-                "maxPriorityFeePerGas": w3.to_wei("2", "gwei"),
-                "maxFeePerGas": w3.to_wei("50", "gwei"),
-                "chainId": w3.eth.chain_id
-            }
-            nonce += 1
-            signed_tx = w3.eth.account.sign_transaction(tx, PRIVATE_KEY)
-            tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-            receipts.append({"tx_hash": tx_hash.hex(), "status": receipt.status})
-            
-            # Log the transaction details locally
-            transaction_data = {
-                "tx_hash": tx_hash.hex(),
-                "status": receipt.status,
-                "recipient": recipients[i],
-                "amount": values[i],
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            log_bulk_transfer_transaction(log_csv_path, transaction_data)
-        
-        return {"status": "success", "data": receipts}
+        result = pooled_bulk_transfer(w3, sender_pool_keys(), resolve_roster(**(roster or {})), log_csv_path)
+        if result["status"] == "error":
+            print(result["message"])
+        return result
     except Exception as e:
         print(f"Error in bulk transfer: {e}")
         return {"status": "error", "message": f"Error in bulk transfer: {e}"}
@@ -295,64 +2894,464 @@ def complete_bulk_transfer(log_filename=None):
 # ----------------------
 # Function: Silent Bulk Transfer with Logging
 # ----------------------
-def silent_bulk_transfer(rpc_url, employees_json, log_filename=None):
+def silent_bulk_transfer(rpc_url=None, employees_json=None, log_filename=None, roster=None):
     """
     Executes bulk transfers and logs each transaction to a local CSV file.
+    Employees come from employees_json if given, otherwise from the roster selectors.
     """
     if log_filename is None:
         log_filename = DEFAULT_TRANSACTION_LOG
-        
+
     log_csv_path = os.path.join(DATA_DIR, log_filename)
 
     try:
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
-        if not w3.is_connected():
+        with stage_timer("rpc_connect"):
+            w3, connected = prefetched(("web3", rpc_url or SONIC_RPC_URL), connect_checked, rpc_url or SONIC_RPC_URL)
+        if not connected:
             return {"status": "error", "message": "Could not connect to Ethereum node"}
-        
-        PRIVATE_KEY = os.getenv("PRIVATE_KEY")
-        account = w3.eth.account.from_key(PRIVATE_KEY)
-        sender_address = account.address
 
-        if isinstance(employees_json, str):
-            employees = json.loads(employees_json)
+        if employees_json:
+            employees = iter_employees_json(employees_json)
         else:
-            employees = employees_json
-
-        recipients = [emp["accountId"] for emp in employees]
-        values = [w3.to_wei(str(emp["salary"]), "ether") for emp in employees]
-
-        nonce = w3.eth.get_transaction_count(sender_address, "pending")
-        receipts = []
-        for i in range(len(recipients)):
-            tx = {
-                "to": recipients[i],
-                "value": values[i],
-                "nonce": nonce,
-                "gas": 21000,
-                "maxPriorityFeePerGas": w3.to_wei("2", "gwei"),
-                "maxFeePerGas": w3.to_wei("50", "gwei"),
-                "chainId": w3.eth.chain_id
-            }
-            nonce += 1
-            signed_tx = w3.eth.account.sign_transaction(tx, PRIVATE_KEY)
-            tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-            receipts.append({"tx_hash": tx_hash.hex(), "status": receipt.status})
-            
-            transaction_data = {
-                "tx_hash": tx_hash.hex(),
-                "status": receipt.status,
-                "recipient": recipients[i],
-                "amount": values[i],
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            log_bulk_transfer_transaction(log_csv_path, transaction_data)
-        
-        return {"status": "success", "data": receipts}
+            employees = resolve_roster(**(roster or {}))
+        result = pooled_bulk_transfer(w3, sender_pool_keys(), employees, log_csv_path)
+        if result["status"] == "error":
+            print(result["message"])
+        return result
     except Exception as e:
         print(f"Error in bulk transfer: {e}")
         return {"status": "error", "message": f"Error in bulk transfer: {e}"}
 
+# ----------------------
+# Payroll Plans (compile now, broadcast on payday)
+# ----------------------
+# plan_payroll does all the expensive work ahead of time: it reads the roster,
+# validates and checksums recipients, converts salaries to wei, assigns nonces,
+# fixes the fee envelope and signs every transaction. The plan is persisted as a
+# JSON header (totals for review) plus an NDJSON file of signed transactions, so
+# execute_payroll_plan only has to broadcast and log.
+PAYROLL_PLAN_DIR = os.path.join(DATA_DIR, "payroll_plans")
+
+def _plan_paths(plan_id):
+    if not re.fullmatch(r"[0-9a-f]{32}", plan_id or ""):
+        raise ValueError(f"Invalid plan id: {plan_id}")
+    base = os.path.join(PAYROLL_PLAN_DIR, plan_id)
+    return f"{base}.json", f"{base}.transactions.ndjson"
+
+def load_payroll_plan(plan_id):
+    """
+    Returns the header (metadata and totals) of a saved payroll plan.
+    """
+    header_path, _ = _plan_paths(plan_id)
+    with open(header_path, "r") as f:
+        return json.load(f)
+
+def _save_payroll_plan(plan):
+    header_path, _ = _plan_paths(plan["plan_id"])
+    tmp_path = f"{header_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(plan, f, indent=2)
+    os.replace(tmp_path, header_path)
+
+def plan_payroll(rpc_url=None, employees=None, roster=None):
+    """
+    Compiles the payroll into a reviewable plan of pre-signed transactions.
+    employees defaults to the employees matched by the roster selectors.
+    """
+    rpc_url = rpc_url or SONIC_RPC_URL
+    os.makedirs(PAYROLL_PLAN_DIR, exist_ok=True)
+    plan_id = uuid.uuid4().hex
+    header_path, txs_path = _plan_paths(plan_id)
+
+    try:
+        with stage_timer("rpc_connect"):
+            w3, connected = prefetched(("web3", rpc_url), connect_checked, rpc_url)
+        if not connected:
+            return {"status": "error", "message": "Could not connect to Ethereum node"}
+
+        run = BulkTransfer(w3, os.getenv("PRIVATE_KEY"))
+        run.prepare(planning=True)
+        first_nonce = run.nonce
+        totals = {"transactions": 0, "total_wei": 0, "max_gas_cost_wei": 0}
+
+        if employees is None:
+            employees = resolve_roster(**(roster or {}))
+
+        with open(txs_path, "w") as txs_file:
+            def write(signed):
+                tx = signed["tx"]
+                txs_file.write(json.dumps({
+                    "nonce": tx["nonce"],
+                    "to": tx["to"],
+                    "value": str(tx["value"]),
+                    "employee": signed.get("employee"),
+                    "tx_hash": to_hex(signed["hash"]),
+                    "raw": to_hex(signed["raw"])
+                }) + "\n")
+                totals["transactions"] += 1
+                totals["total_wei"] += tx["value"]
+                totals["max_gas_cost_wei"] += tx["gas"] * tx["maxFeePerGas"]
+
+            errors = run_pipeline(run.read(employees), [run.validate, run.build, run.sign, write])
+        if errors:
+            os.remove(txs_path)
+            return {"status": "error", "message": f"Error planning payroll: {errors[0]}"}
+
+        balance = w3.eth.get_balance(run.account.address)
+        base_fee = prefetched(("base_fee", rpc_url), lambda: w3.eth.get_block("latest").get("baseFeePerGas"))
+        required = totals["total_wei"] + totals["max_gas_cost_wei"]
+        plan = {
+            "plan_id": plan_id,
+            "status": "planned",
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "rpc_url": rpc_url,
+            "roster": roster or {},
+            "chain_id": run.chain_id,
+            "sender": run.account.address,
+            "first_nonce": first_nonce,
+            "last_nonce": run.nonce - 1,
+            "fee_envelope": {
+                "gas": TRANSFER_GAS_LIMIT,
+                "max_priority_fee_per_gas": run.max_priority_fee,
+                "max_fee_per_gas": run.max_fee,
+                "base_fee_at_plan_time": base_fee
+            },
+            "totals": {
+                "transactions": totals["transactions"],
+                "skipped": run.summary["skipped"],
+                "total_wei": str(totals["total_wei"]),
+                "total_ether": str(w3.from_wei(totals["total_wei"], "ether")),
+                "max_gas_cost_wei": str(totals["max_gas_cost_wei"]),
+                "sender_balance_wei": str(balance),
+                "sufficient_balance": balance >= required
+            },
+            "skipped": run.skipped
+        }
+        _save_payroll_plan(plan)
+        return {"status": "success", "data": plan}
+    except Exception as e:
+        print(f"Error planning payroll: {e}")
+        if os.path.exists(txs_path):
+            os.remove(txs_path)
+        return {"status": "error", "message": f"Error planning payroll: {e}"}
+
+def execute_payroll_plan(plan_id, log_filename=None):
+    """
+    Broadcasts the pre-signed transactions of a saved plan and logs each one.
+    A partially executed plan resumes from the sender's current nonce.
+    """
+    if log_filename is None:
+        log_filename = DEFAULT_TRANSACTION_LOG
+    log_csv_path = os.path.join(DATA_DIR, log_filename)
+
+    try:
+        plan = load_payroll_plan(plan_id)
+        _, txs_path = _plan_paths(plan_id)
+        if plan["status"] == "executed":
+            return {"status": "error", "message": f"Plan {plan_id} has already been executed"}
+
+        with stage_timer("rpc_connect"):
+            w3, connected = prefetched(("web3", plan["rpc_url"]), connect_checked, plan["rpc_url"])
+        if not connected:
+            return {"status": "error", "message": "Could not connect to Ethereum node"}
+        if w3.eth.chain_id != plan["chain_id"]:
+            return {"status": "error", "message": "Plan was signed for a different chain"}
+
+        chain_nonce = w3.eth.get_transaction_count(plan["sender"], "pending")
+        start = chain_nonce if plan["status"] == "executing" else plan["first_nonce"]
+        nonce_manager = get_nonce_manager(w3, plan["chain_id"], plan["sender"])
+        if chain_nonce != start or not nonce_manager.claim(start, plan["last_nonce"], plan_id):
+            return {"status": "error", "message": (
+                f"Plan is stale: sender nonce is {chain_nonce} but the plan starts at {start} "
+                "or its nonces were taken by another run. Create a new plan."
+            )}
+
+        fee_envelope = plan["fee_envelope"]
+
+        def read_plan():
+            with open(txs_path, "r") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry["nonce"] < chain_nonce:
+                        continue
+                    yield {
+                        "tx": {
+                            "to": entry["to"],
+                            "value": int(entry["value"]),
+                            "nonce": entry["nonce"],
+                            "gas": fee_envelope["gas"],
+                            "maxPriorityFeePerGas": fee_envelope["max_priority_fee_per_gas"],
+                            "maxFeePerGas": fee_envelope["max_fee_per_gas"],
+                            "chainId": plan["chain_id"]
+                        },
+                        "raw": bytes.fromhex(entry["raw"].removeprefix("0x")),
+                        "hash": bytes.fromhex(entry["tx_hash"].removeprefix("0x")),
+                        "employee": entry.get("employee")
+                    }
+
+        plan["status"] = "executing"
+        _save_payroll_plan(plan)
+        # The sender's key is only needed to re-sign stuck transactions with higher fees
+        private_key = os.getenv("PRIVATE_KEY")
+        if not private_key or w3.eth.account.from_key(private_key).address != plan["sender"]:
+            private_key = None
+        run = BulkTransfer(w3, private_key, log_csv_path)
+        run.adopt_nonces(nonce_manager, plan_id, range(start, plan["last_nonce"] + 1))
+        errors = run.run(read_plan(), [run.broadcast, run.log])
+        result = run.result(errors)
+
+        plan["status"] = "executing" if errors else "executed"
+        plan["executed_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        _save_payroll_plan(plan)
+        result["plan_id"] = plan_id
+        return result
+    except FileNotFoundError:
+        return {"status": "error", "message": f"Unknown payroll plan: {plan_id}"}
+    except Exception as e:
+        print(f"Error executing payroll plan: {e}")
+        return {"status": "error", "message": f"Error executing payroll plan: {e}"}
+
+# ----------------------
+# Transfer Log Reconciliation
+# ----------------------
+# Checks logged transfers against the chain: status, recipient and amount of every
+# tx_hash, plus transactions that are missing or still pending. Receipts and
+# transactions are fetched with JSON-RPC batch requests, several batches at a time.
+# A per-log checkpoint (byte offset) records how far rows have been verified with
+# enough confirmations to be safe from reorgs, so later runs only check new rows.
+# It also records the file's identity and the last verified tx_hash; if the log has
+# been replaced or rewritten (e.g. upgraded to a new header) it is checked in full.
+RECONCILE_CHECKPOINT_FILE = os.path.join(DATA_DIR, "reconcile_checkpoint.json")
+RECONCILE_ISSUES_FILE = os.path.join(DATA_DIR, "reconcile_issues.ndjson")
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "100"))
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "4"))
+RECONCILE_CONFIRMATIONS = int(os.getenv("RECONCILE_CONFIRMATIONS", "12"))
+RECONCILE_MISSING_GRACE_SECONDS = float(os.getenv("RECONCILE_MISSING_GRACE_SECONDS", "3600"))
+RECONCILE_MAX_ISSUES = 50
+
+def rpc_batch(w3, calls):
+    """
+    Sends [(method, params), ...] as one JSON-RPC batch and returns the results in
+    order (None for null results). Providers without batch support get one
+    (formatted) request per call instead. Raises on RPC errors.
+    """
+    if not calls:
+        return []
+    make_batch_request = getattr(w3.provider, "make_batch_request", None)
+    responses = None
+    if make_batch_request is not None:
+        try:
+            responses = make_batch_request(calls)
+        except (NotImplementedError, TypeError):
+            responses = None
+    if responses is None:
+        return [w3.manager.request_blocking(method, params) for method, params in calls]
+    if isinstance(responses, dict):
+        raise RuntimeError(f"RPC batch failed: {responses.get('error')}")
+    results = []
+    for response in responses:
+        if response.get("error"):
+            raise RuntimeError(f"RPC error: {response['error']}")
+        results.append(response.get("result"))
+    return results
+
+def _hex_int(value):
+    if value is None:
+        return None
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+def _logged_wei(amount):
+    try:
+        return int(amount)
+    except (TypeError, ValueError):
+        # Older logs may store ether amounts
+        return int(decimal.Decimal(str(amount)) * 10 ** 18)
+
+def _iter_log_rows(log_csv_path, offset):
+    """
+    Yields (end_offset, row) for the complete rows of the log after byte offset.
+    """
+    with open(log_csv_path, mode='rb') as file:
+        header = next(csv.reader([file.readline().decode("utf-8")]), None)
+        if not header:
+            return
+        if offset:
+            file.seek(offset)
+        while True:
+            line = file.readline()
+            if not line:
+                break
+            if not line.endswith(b"\n"):
+                # Row still being written by a running transfer
+                break
+            if line.strip():
+                yield file.tell(), dict(zip(header, next(csv.reader([line.decode("utf-8")]))))
+
+def _check_rows(w3, rows, latest_block):
+    """
+    Fetches receipts and transactions for a batch of log rows and returns one
+    finding per row: {"row", "result", "issues", "final"}.
+    """
+    calls = []
+    for row in rows:
+        calls.append(("eth_getTransactionReceipt", [row["tx_hash"]]))
+        calls.append(("eth_getTransactionByHash", [row["tx_hash"]]))
+    with stage_timer("reconcile_rpc"):
+        results = rpc_batch(w3, calls)
+
+    findings = []
+    for i, row in enumerate(rows):
+        receipt, tx = results[2 * i], results[2 * i + 1]
+        issues = []
+        final = False
+        if tx is None and receipt is None:
+            # Dropped for good once it has been missing for longer than the grace period
+            result = "missing"
+            try:
+                logged_at = datetime.strptime(row.get("timestamp") or "", "%Y-%m-%d %H:%M:%S")
+                final = (datetime.now() - logged_at).total_seconds() >= RECONCILE_MISSING_GRACE_SECONDS
+            except ValueError:
+                final = True
+            issues.append("transaction not found on chain")
+        elif receipt is None:
+            result = "pending"
+        else:
+            chain_status = _hex_int(receipt.get("status"))
+            if str(row.get("status")) != str(chain_status):
+                issues.append(f"status logged as {row.get('status')}, on chain {chain_status}")
+            if tx is not None:
+                if (tx.get("to") or "").lower() != (row.get("recipient") or "").lower():
+                    issues.append(f"recipient logged as {row.get('recipient')}, on chain {tx.get('to')}")
+                try:
+                    logged = _logged_wei(row.get("amount"))
+                except (decimal.InvalidOperation, ValueError):
+                    logged = None
+                if logged != _hex_int(tx.get("value")):
+                    issues.append(f"amount logged as {row.get('amount')}, on chain {_hex_int(tx.get('value'))}")
+            confirmations = latest_block - _hex_int(receipt.get("blockNumber")) + 1
+            final = confirmations >= RECONCILE_CONFIRMATIONS
+            result = "mismatch" if issues else ("ok" if final else "unconfirmed")
+        findings.append({"row": row, "result": result, "issues": issues, "final": final})
+    return findings
+
+def _load_reconcile_checkpoints():
+    try:
+        with open(RECONCILE_CHECKPOINT_FILE, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_reconcile_checkpoint(log_csv_path, checkpoint):
+    checkpoints = _load_reconcile_checkpoints()
+    checkpoints[os.path.abspath(log_csv_path)] = checkpoint
+    tmp_path = f"{RECONCILE_CHECKPOINT_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoints, f, indent=2)
+    os.replace(tmp_path, RECONCILE_CHECKPOINT_FILE)
+
+def _checkpoint_valid(log_csv_path, checkpoint):
+    """
+    True if the checkpoint's byte offset still points just past its last verified
+    row in this same file.
+    """
+    offset = checkpoint.get("offset", 0)
+    if not offset:
+        return True
+    stat = os.stat(log_csv_path)
+    if checkpoint.get("inode") != stat.st_ino or offset > stat.st_size or not checkpoint.get("tx_hash"):
+        return False
+    with open(log_csv_path, mode='rb') as file:
+        file.seek(max(0, offset - 4096))
+        tail = file.read(offset - max(0, offset - 4096))
+    if not tail.endswith(b"\n"):
+        return False
+    last_line = tail.rstrip(b"\r\n").rsplit(b"\n", 1)[-1].decode("utf-8", errors="replace")
+    return checkpoint["tx_hash"] in last_line
+
+def reconcile_transfer_log(log_filename=None, rpc_url=None, full=False, w3=None):
+    """
+    Verifies logged transfers against the chain and flags status, recipient and amount
+    mismatches and missing transactions. Resumes from the last checkpoint unless full.
+    """
+    if log_filename is None:
+        log_filename = DEFAULT_TRANSACTION_LOG
+    log_csv_path = os.path.join(DATA_DIR, log_filename)
+    if not os.path.exists(log_csv_path):
+        return {"status": "error", "message": f"Transaction log not found: {log_filename}"}
+
+    try:
+        if w3 is None:
+            with stage_timer("rpc_connect"):
+                w3 = connect_web3(rpc_url or SONIC_RPC_URL)
+        latest_block = w3.eth.block_number
+        # Upgrade first: it rewrites the file, which would shift every byte offset
+        _upgrade_transfer_log(log_csv_path)
+        checkpoint = {} if full else _load_reconcile_checkpoints().get(os.path.abspath(log_csv_path), {})
+        if not _checkpoint_valid(log_csv_path, checkpoint):
+            # The log was replaced, rewritten or truncated; start over
+            checkpoint = {}
+        offset, verified_rows = checkpoint.get("offset", 0), checkpoint.get("rows", 0)
+        last_verified = checkpoint.get("tx_hash")
+
+        counts = collections.Counter()
+        issues = []
+        window = RECONCILE_BATCH_SIZE * RECONCILE_CONCURRENCY
+        rows = _iter_log_rows(log_csv_path, offset)
+        prefix_final = True
+        with ThreadPoolExecutor(max_workers=RECONCILE_CONCURRENCY) as pool:
+            while True:
+                chunk = [item for _, item in zip(range(window), rows)]
+                if not chunk:
+                    break
+                batches = [chunk[i:i + RECONCILE_BATCH_SIZE] for i in range(0, len(chunk), RECONCILE_BATCH_SIZE)]
+                futures = [pool.submit(_check_rows, w3, [row for _, row in batch], latest_block) for batch in batches]
+                findings = [finding for future in futures for finding in future.result()]
+
+                for (end_offset, _), finding in zip(chunk, findings):
+                    counts[finding["result"]] += 1
+                    if finding["result"] in ("mismatch", "missing") and len(issues) < RECONCILE_MAX_ISSUES:
+                        issues.append({
+                            "tx_hash": finding["row"].get("tx_hash"),
+                            "result": finding["result"],
+                            "issues": finding["issues"]
+                        })
+                    # Only the unbroken run of confirmed rows is safe to skip next time
+                    if prefix_final and finding["final"]:
+                        offset, verified_rows = end_offset, verified_rows + 1
+                        last_verified = finding["row"].get("tx_hash")
+                        if finding["issues"]:
+                            with open(RECONCILE_ISSUES_FILE, "a") as f:
+                                f.write(json.dumps({"tx_hash": finding["row"].get("tx_hash"), "issues": finding["issues"],
+                                                    "checked_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}) + "\n")
+                    else:
+                        prefix_final = False
+
+        _save_reconcile_checkpoint(log_csv_path, {
+            "offset": offset,
+            "rows": verified_rows,
+            "inode": os.stat(log_csv_path).st_ino,
+            "tx_hash": last_verified,
+            "block": latest_block,
+            "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+        checked = sum(counts.values())
+        return {
+            "status": "success",
+            "summary": {
+                "checked": checked,
+                "ok": counts["ok"],
+                "mismatched": counts["mismatch"],
+                "missing": counts["missing"],
+                "pending": counts["pending"],
+                "unconfirmed": counts["unconfirmed"],
+                "verified_rows": verified_rows
+            },
+            "issues": issues,
+            "truncated": counts["mismatch"] + counts["missing"] > len(issues)
+        }
+    except Exception as e:
+        return {"status": "error", "message": f"Error reconciling transaction log: {str(e)}"}
+
 # ----------------------
 # Function: Transaction Insights
 # ----------------------
@@ -366,7 +3365,7 @@ def transaction_insights(log_filename=None, prompt="Generate insights based on t
     log_csv_path = os.path.join(DATA_DIR, log_filename)
     try:
         transactions = []
-        with open(log_csv_path, mode='r', newline='') as file:
+        with stage_timer("csv_read"), open(log_csv_path, mode='r', newline='') as file:
             reader = csv.DictReader(file)
             for row in reader:
                 transactions.append(row)
@@ -381,7 +3380,7 @@ def transaction_insights(log_filename=None, prompt="Generate insights based on t
             {"role": "system", "content": "You are an expert analyst."},
             {"role": "user", "content": f"{prompt}\n{summary}"}
         ]
-        response = openai.ChatCompletion.create(model="gpt-4o", messages=messages)
+        response, _ = routed_completion("transaction_insights", messages=messages)
         insights = response["choices"][0]["message"]["content"]
         return {"status": "success", "data": insights}
     except Exception as e:
@@ -712,7 +3711,7 @@ def crypto_knowledge_query(query):
             {"role": "user", "content": prompt}
         ]
         
-        response = openai.ChatCompletion.create(model="gpt-4o", messages=messages)
+        response, _ = routed_completion("crypto_knowledge_query", messages=messages)
         explanation = response["choices"][0]["message"]["content"].strip()
         
         return {"status": "success", "data": {
@@ -722,53 +3721,403 @@ def crypto_knowledge_query(query):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-# ----------------------
-# New Function: Generate Payroll Schedule
-# ----------------------
-def generate_payroll_schedule(start_date, frequency, employees_count):
+# ----------------------
+# New Function: Generate Payroll Schedule
+# ----------------------
+def generate_payroll_schedule(start_date, frequency, employees_count):
+    """
+    Generates a recommended payroll schedule based on parameters.
+    """
+    try:
+        from datetime import datetime, timedelta
+        
+        start_date = datetime.strptime(start_date, "%Y-%m-%d")
+        schedule = []
+        
+        frequencies = {
+            "weekly": 7,
+            "biweekly": 14,
+            "monthly": 30
+        }
+        
+        if frequency not in frequencies:
+            return {"status": "error", "message": "Invalid frequency. Please choose weekly, biweekly, or monthly."}
+        
+        days_increment = frequencies[frequency]
+        
+        # Generate 6 pay periods
+        current_date = start_date
+        for i in range(6):
+            process_date = current_date - timedelta(days=2)  # Process 2 days before payment
+            
+            schedule.append({
+                "pay_period": i + 1,
+                "process_date": process_date.strftime("%Y-%m-%d"),
+                "payment_date": current_date.strftime("%Y-%m-%d"),
+                "employees": employees_count,
+                "estimated_gas_cost": round(0.002 * employees_count, 4),
+                "estimated_process_time": "5 minutes"
+            })
+            
+            current_date += timedelta(days=days_increment)
+        
+        return {"status": "success", "data": {
+            "frequency": frequency,
+            "start_date": start_date.strftime("%Y-%m-%d"),
+            "schedule": schedule
+        }}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+# ----------------------
+# Knowledge Retrieval (BM25)
+# ----------------------
+# Product knowledge (overview, features, FAQ, guides, comparison, case studies and
+# any text files under data/knowledge) is split into short passages and indexed with
+# BM25. Each turn only the top-k passages relevant to the message go into the system
+# prompt, so the knowledge base can grow without making every request bigger.
+KNOWLEDGE_DIR = os.path.join(DATA_DIR, "knowledge")
+KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "4"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+PAYZOLL_OVERVIEW = [
+    "Global Reach: Pay your entire workforce across borders in seconds with one click.",
+    "Cost Efficiency: Slash transaction costs by 80% using multi-chain blockchain technology.",
+    "Security: Immutable ledger records and smart contracts protect every transaction.",
+    "AI Automation: Eliminate errors with seamless, hands-off payroll management.",
+    "Scalability: Built for businesses from 10 to 10,000+ employees.",
+    "Volatility Protection: Auto-swaps to stablecoins (USDT) ensure payment value stability.",
+    "Fiat Integration: Seamless off-ramping from crypto to traditional currencies.",
+    "Multi-Chain Architecture: Works across Ethereum, BNB Chain, Polygon, and Sonic networks.",
+    "Compliance Management: AI-driven tax and regulatory compliance across jurisdictions.",
+    "Awards: PayZoll won first place at ETH India 2024 for pioneering multi-chain payroll architecture and "
+    "first place at Binance Web3 Build for Web3 payroll excellence.",
+    "Sonic: The platform integrates with Sonic blockchain for enhanced AI agent capabilities.",
+]
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or our "
+    "the this to we what when which who why will with you your".split()
+)
+
+def tokenize(text):
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+def _passage_text(item):
+    """
+    Renders one knowledge item (string or dict) as a single line of text.
+    """
+    if not isinstance(item, dict):
+        return str(item)
+    parts = []
+    for key, value in item.items():
+        if isinstance(value, list):
+            value = "; ".join(str(v) for v in value)
+        parts.append(f"{key.replace('_', ' ')}: {value}")
+    return ". ".join(parts)
+
+def _content_passages(source, data):
+    """
+    Splits a content payload into passages: one per list item, one per scalar field.
+    """
+    if isinstance(data, list):
+        return [(source, _passage_text(item)) for item in data]
+    passages = []
+    title = data.get("title", source)
+    for key, value in data.items():
+        if key == "title":
+            continue
+        if isinstance(value, list) and value and isinstance(value[0], dict):
+            passages += [(source, f"{title} - {_passage_text(item)}") for item in value]
+        elif isinstance(value, list):
+            passages.append((source, f"{title} - {key.replace('_', ' ')}: " + "; ".join(map(str, value))))
+        else:
+            passages.append((source, f"{title} - {key.replace('_', ' ')}: {value}"))
+    return passages
+
+def knowledge_passages():
+    """
+    Collects every passage the retrieval index is built from.
+    """
+    passages = [("overview", text) for text in PAYZOLL_OVERVIEW]
+    for name, fn in STATIC_CONTENT.items():
+        passages += _content_passages(name, fn()["data"])
+    if os.path.isdir(KNOWLEDGE_DIR):
+        for filename in sorted(os.listdir(KNOWLEDGE_DIR)):
+            if not filename.endswith((".md", ".txt")):
+                continue
+            with open(os.path.join(KNOWLEDGE_DIR, filename), "r", encoding="utf-8") as f:
+                paragraphs = re.split(r"\n\s*\n", f.read())
+            passages += [(filename, " ".join(p.split())) for p in paragraphs if p.strip()]
+    return passages
+
+class BM25Index:
+    """
+    Okapi BM25 over a list of (source, text) passages.
+    """
+    def __init__(self, passages):
+        self.passages = passages
+        self.doc_lengths = []
+        self.postings = collections.defaultdict(list)
+        for doc_id, (_, text) in enumerate(passages):
+            counts = collections.Counter(tokenize(text))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((doc_id, tf))
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        n = len(passages)
+        self.idf = {term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5)) for term, docs in self.postings.items()}
+
+    def search(self, query, k=KNOWLEDGE_TOP_K):
+        """
+        Returns up to k (score, source, text) tuples, best first.
+        """
+        scores = collections.defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, *self.passages[doc_id]) for doc_id, score in best]
+
+_knowledge_index = None
+_knowledge_index_lock = threading.Lock()
+
+def get_knowledge_index():
+    """
+    Builds the knowledge index on first use and returns it.
+    """
+    global _knowledge_index
+    with _knowledge_index_lock:
+        if _knowledge_index is None:
+            _knowledge_index = BM25Index(knowledge_passages())
+        return _knowledge_index
+
+def retrieve_knowledge(query, k=KNOWLEDGE_TOP_K):
+    """
+    Returns the texts of the k passages most relevant to the query.
+    """
+    with stage_timer("retrieval"):
+        return [text for _, _, text in get_knowledge_index().search(query, k)]
+
+# ----------------------
+# Speculative Prefetch
+# ----------------------
+# While the model deliberates, the tools it is likely to pick are guessed from the
+# message (and, for short follow-ups like "yes, go ahead", the last assistant reply)
+# and their cold dependencies are warmed on a small pool: the Web3 connection, chain
+# id, the primary sender's nonce, latest base fee and the roster CSV parse. Tools
+# take a warm value through prefetched(); on a wrong guess the values are dropped
+# with the request and work that hasn't started is cancelled.
+PREFETCH_ENABLED = os.getenv("PREFETCH", "on").lower() not in ("off", "0", "false")
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+# Longest a tool waits for an in-flight prefetch before doing the work itself
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "10"))
+# Rosters up to this size are parsed once and cached; bigger ones keep streaming
+ROSTER_CACHE_MAX_BYTES = int(os.getenv("ROSTER_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+ROSTER_CACHE_MAX_FILES = 16
+
+PREFETCH_PATTERNS = (
+    ("chain", re.compile(r"\b(pay|paying|payroll|payout|transfer|salar(y|ies)|send|disburse|plan|execute)\b", re.IGNORECASE)),
+    ("roster", re.compile(r"\b(pay|payroll|transfer|salar(y|ies)|analytics?|employees?|staff|team|roster|headcount|company)\b", re.IGNORECASE)),
+)
+FOLLOW_UP_PATTERN = re.compile(r"^\s*(yes|yep|yeah|sure|ok(ay)?|go ahead|do it|proceed|confirm(ed)?|please do)\b", re.IGNORECASE)
+
+metrics.describe("payzoll_prefetch_total", "counter", "Speculatively prefetched resources by outcome (hit, miss, failed, unused)")
+
+_prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+_roster_cache = {}
+_roster_cache_lock = threading.Lock()
+
+def cached_csv_rows(file_path):
+    """
+    Returns the rows of a CSV file as dicts, parsed once per (size, mtime) and shared
+    between requests, so callers must copy a row before changing it. Files above
+    ROSTER_CACHE_MAX_BYTES return None.
+    """
+    stat = os.stat(file_path)
+    if stat.st_size > ROSTER_CACHE_MAX_BYTES:
+        return None
+    version = (stat.st_size, stat.st_mtime_ns)
+    with _roster_cache_lock:
+        entry = _roster_cache.get(file_path)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    with stage_timer("csv_read"), open(file_path, mode='r', newline='') as file:
+        rows = list(csv.DictReader(file))
+    with _roster_cache_lock:
+        _roster_cache.pop(file_path, None)
+        if len(_roster_cache) >= ROSTER_CACHE_MAX_FILES:
+            _roster_cache.pop(next(iter(_roster_cache)))
+        _roster_cache[file_path] = (version, rows)
+    return rows
+
+def warm_csv_rows(file_path):
+    """
+    Returns the cached rows of a file if they are already parsed and current, else None.
+    """
+    with _roster_cache_lock:
+        entry = _roster_cache.get(file_path)
+    if entry is None:
+        return None
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return entry[1] if entry[0] == (stat.st_size, stat.st_mtime_ns) else None
+
+def connect_checked(rpc_url):
+    """
+    Connects to an RPC node; returns (w3, connected).
+    """
+    w3 = connect_web3(rpc_url)
+    return w3, w3.is_connected()
+
+class Prefetch:
+    """
+    Values warmed for one request, each behind a future a tool can wait on.
+    """
+    def __init__(self):
+        self.futures = {}
+        self.tasks = []
+
+    def start(self, keys, task, *args):
+        """
+        Runs task(*args) on the prefetch pool. The task yields (key, value) pairs for
+        the keys it warms; keys it never yields fail, so waiting tools fall back.
+        """
+        futures = {key: Future() for key in keys}
+        self.futures.update(futures)
+        self.tasks.append(_prefetch_pool.submit(self._run, futures, task, args))
+
+    @staticmethod
+    def _run(futures, task, args):
+        error = None
+        started = time.perf_counter()
+        try:
+            for key, value in task(*args):
+                future = futures.get(key)
+                if future is not None and future.set_running_or_notify_cancel():
+                    future.set_result(value)
+        except Exception as e:
+            error = e
+        finally:
+            record_stage("prefetch", time.perf_counter() - started, resource=task.__name__.removeprefix("_warm_"))
+        for future in futures.values():
+            if not future.done() and future.set_running_or_notify_cancel():
+                future.set_exception(error or LookupError("not prefetched"))
+
+    def take(self, key):
+        return self.futures.pop(key, None)
+
+    def discard(self):
+        """
+        Cancels work that hasn't started and drops values no tool asked for.
+        """
+        for task in self.tasks:
+            task.cancel()
+        for key, future in self.futures.items():
+            future.cancel()
+            metrics.inc("payzoll_prefetch_total", {"resource": key[0], "outcome": "unused"})
+        self.futures.clear()
+
+def prefetched(key, compute, *args):
+    """
+    Returns the value this request's prefetch warmed for key, waiting for it if it is
+    still in flight, or compute(*args) when nothing was prefetched or it failed.
+    """
+    prefetch = getattr(_request_state, "prefetch", None)
+    future = prefetch.take(key) if prefetch is not None else None
+    if future is not None:
+        started = time.perf_counter()
+        try:
+            value = future.result(timeout=PREFETCH_WAIT_SECONDS)
+            metrics.inc("payzoll_prefetch_total", {"resource": key[0], "outcome": "hit"})
+            return value
+        except Exception as e:
+            print(f"Prefetched {key[0]} unavailable, fetching it now: {e}")
+            metrics.inc("payzoll_prefetch_total", {"resource": key[0], "outcome": "failed"})
+        finally:
+            record_stage("prefetch_wait", time.perf_counter() - started, resource=key[0])
+    elif prefetch is not None:
+        metrics.inc("payzoll_prefetch_total", {"resource": key[0], "outcome": "miss"})
+    return compute(*args)
+
+def guess_prefetch(message, chat_history):
     """
-    Generates a recommended payroll schedule based on parameters.
+    Returns the resource groups ("chain", "roster") the message will likely need and
+    the company ids it mentions.
     """
-    try:
-        from datetime import datetime, timedelta
-        
-        start_date = datetime.strptime(start_date, "%Y-%m-%d")
-        schedule = []
-        
-        frequencies = {
-            "weekly": 7,
-            "biweekly": 14,
-            "monthly": 30
-        }
-        
-        if frequency not in frequencies:
-            return {"status": "error", "message": "Invalid frequency. Please choose weekly, biweekly, or monthly."}
-        
-        days_increment = frequencies[frequency]
-        
-        # Generate 6 pay periods
-        current_date = start_date
-        for i in range(6):
-            process_date = current_date - timedelta(days=2)  # Process 2 days before payment
-            
-            schedule.append({
-                "pay_period": i + 1,
-                "process_date": process_date.strftime("%Y-%m-%d"),
-                "payment_date": current_date.strftime("%Y-%m-%d"),
-                "employees": employees_count,
-                "estimated_gas_cost": round(0.002 * employees_count, 4),
-                "estimated_process_time": "5 minutes"
-            })
-            
-            current_date += timedelta(days=days_increment)
-        
-        return {"status": "success", "data": {
-            "frequency": frequency,
-            "start_date": start_date.strftime("%Y-%m-%d"),
-            "schedule": schedule
-        }}
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    text = message
+    if FOLLOW_UP_PATTERN.match(message) or len(message.split()) <= 3:
+        last_reply = next((m["content"] for m in reversed(chat_history) if m.get("role") == "assistant" and m.get("content")), "")
+        text = f"{message}\n{last_reply}"
+    groups = {group for group, pattern in PREFETCH_PATTERNS if pattern.search(text)}
+    companies = []
+    if "roster" in groups and os.path.isdir(COMPANIES_DIR):
+        lowered = text.lower()
+        companies = [name for name in os.listdir(COMPANIES_DIR)
+                     if not name.startswith(".") and re.search(rf"\b{re.escape(name.lower())}\b", lowered)]
+    return groups, companies
+
+def _warm_chain(rpc_url):
+    w3, connected = connect_checked(rpc_url)
+    yield ("web3", rpc_url), (w3, connected)
+    if not connected:
+        return
+    chain_id = w3.eth.chain_id
+    yield ("chain_id", rpc_url), chain_id
+    yield ("base_fee", rpc_url), w3.eth.get_block("latest").get("baseFeePerGas")
+    # Only the primary sender: this is a guess, and other lanes look up their own
+    key = sender_pool_keys()[0]
+    if key:
+        sender = w3.eth.account.from_key(key).address
+        manager = get_nonce_manager(w3, chain_id, sender)
+        # Both taken before the lookups, so any write racing them voids the counts
+        fetched_at, version = time.time(), manager.version()
+        mined = w3.eth.get_transaction_count(sender, "latest")
+        pending = w3.eth.get_transaction_count(sender, "pending")
+        manager.prime(mined, pending, fetched_at, version)
+
+def _warm_rosters(paths):
+    for path in paths:
+        yield ("csv", path), cached_csv_rows(path)
+
+def start_prefetch(message, chat_history):
+    """
+    Guesses the tools a message will need and starts warming their dependencies for
+    the current request. Returns the guessed groups.
+    """
+    end_prefetch()
+    if not PREFETCH_ENABLED:
+        return set()
+    groups, companies = guess_prefetch(message, chat_history)
+    if not groups:
+        return groups
+    prefetch = Prefetch()
+    if "chain" in groups:
+        keys = [(resource, SONIC_RPC_URL) for resource in ("web3", "chain_id", "base_fee")]
+        prefetch.start(keys, _warm_chain, SONIC_RPC_URL)
+    if "roster" in groups:
+        paths = [os.path.join(DATA_DIR, DEFAULT_EMPLOYEE_CSV)]
+        paths += [os.path.join(COMPANIES_DIR, company, f"{company}.csv") for company in companies]
+        paths = [path for path in paths if os.path.exists(path)]
+        prefetch.start([("csv", path) for path in paths], _warm_rosters, paths)
+    _request_state.prefetch = prefetch
+    return groups
+
+def end_prefetch():
+    """
+    Discards whatever the current request prefetched and didn't use.
+    """
+    prefetch = getattr(_request_state, "prefetch", None)
+    _request_state.prefetch = None
+    if prefetch is not None:
+        prefetch.discard()
 
 # ----------------------
 # Function: Use AI to identify and execute the appropriate function with chat history memory
@@ -778,10 +4127,20 @@ def process_and_execute_message(message):
     Analyzes a message using GPT to determine which function to call, while including chat history.
     If no function is matched, returns a plain GPT response.
     """
+    note_cassette_message(message)
+
     # Load existing chat history and add the current user message
-    chat_history = load_chat_history()
+    with stage_timer("history_load"):
+        chat_history = load_chat_history()
+    # Warm the likely tools' dependencies while the model deliberates
+    start_prefetch(message, chat_history)
+    context = current_usage_context()
+    if context and context.get("budget") != "ok":
+        # Near or over budget: send less history
+        chat_history = chat_history[-BUDGET_TRIMMED_HISTORY:]
 
-    # Enhanced system prompt with comprehensive PayZoll information
+    # System prompt with only the PayZoll knowledge relevant to this message
+    knowledge = retrieve_knowledge(message)
     system_prompt = {
         "role": "system",
         "content": (
@@ -790,25 +4149,11 @@ def process_and_execute_message(message):
             "cutting-edge AI to deliver lightning-fast, secure, and scalable payroll solutions—bridging the gap between "
             "Web2 simplicity and Web3 potential.\n\n"
             
-            "PayZoll's core capabilities include:\n"
-            "• Global Reach: Pay your entire workforce across borders in seconds with one click.\n"
-            "• Cost Efficiency: Slash transaction costs by 80% using multi-chain blockchain technology.\n"
-            "• Security: Immutable ledger records and smart contracts protect every transaction.\n"
-            "• AI Automation: Eliminate errors with seamless, hands-off payroll management.\n"
-            "• Scalability: Built for businesses from 10 to 10,000+ employees.\n"
-            "• Volatility Protection: Auto-swaps to stablecoins (USDT) ensure payment value stability.\n"
-            "• Fiat Integration: Seamless off-ramping from crypto to traditional currencies.\n"
-            "• Multi-Chain Architecture: Works across Ethereum, BNB Chain, Polygon, and Sonic networks.\n"
-            "• Compliance Management: AI-driven tax and regulatory compliance across jurisdictions.\n\n"
-            
-            "PayZoll has won first place at ETH India 2024 for pioneering multi-chain payroll architecture and "
-            "first place at Binance Web3 Build for Web3 payroll excellence. The platform integrates with Sonic "
-            "blockchain for enhanced AI agent capabilities.\n\n"
-            
             "As PayZollBot, provide knowledgeable, helpful responses about Web3 payroll concepts, blockchain "
             "technology, cryptocurrency, and PayZoll's features. Use previous chat history for context "
             "and deliver clear, concise, and actionable responses. If a function is available to handle the request, "
             "use it. Otherwise, provide informative answers that showcase PayZoll's expertise."
+            + ("\n\nRelevant PayZoll knowledge:\n" + "\n".join(f"• {text}" for text in knowledge) if knowledge else "")
         )
     }
     
@@ -849,6 +4194,20 @@ def process_and_execute_message(message):
                 "required": ["subreddit", "title", "body"]
             }
         },
+        {
+            "name": "cross_post",
+            "description": "Queue one post for Twitter and/or several subreddits at once; returns an outbox id immediately",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "body": {"type": "string", "description": "The content of the post"},
+                    "title": {"type": "string", "description": "Title used for Reddit posts"},
+                    "twitter": {"type": "boolean", "description": "Whether to post on Twitter (default true)"},
+                    "subreddits": {"type": "array", "items": {"type": "string"}, "description": "Subreddits to post to"}
+                },
+                "required": ["body"]
+            }
+        },
         {
             "name": "generate_post",
             "description": "Generate a social media post",
@@ -861,6 +4220,40 @@ def process_and_execute_message(message):
                 "required": ["platform", "description"]
             }
         },
+        {
+            "name": "generate_campaign",
+            "description": "Generate many social media posts at once, e.g. a content calendar: several topics and platforms, several variants each",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "jobs": {
+                        "type": "array",
+                        "description": "One entry per platform and topic",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "platform": {"type": "string", "enum": ["twitter", "reddit"]},
+                                "topic": {"type": "string", "description": "What the posts should be about"},
+                                "variants": {"type": "integer", "description": "How many different posts to generate (max 10)"}
+                            },
+                            "required": ["platform", "topic"]
+                        }
+                    }
+                },
+                "required": ["jobs"]
+            }
+        },
+        {
+            "name": "analyze_comment_sentiment",
+            "description": "Sentiment analysis of the comments people have made on our tweets and Reddit posts, per post and over time",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "twitter_ids": {"type": "array", "items": {"type": "string"}, "description": "Tweet ids to analyze; omit for all our posts"},
+                    "reddit_ids": {"type": "array", "items": {"type": "string"}, "description": "Reddit submission ids to analyze; omit for all our posts"}
+                }
+            }
+        },
         {
             "name": "get_company_details",
             "description": "Get details about employees from the default CSV file",
@@ -873,20 +4266,46 @@ def process_and_execute_message(message):
         },
         {
             "name": "silent_bulk_transfer",
-            "description": "Transfer Sonic to multiple employees and log to default transaction log",
+            "description": "Transfer Sonic to the employees matched by the selectors and log to default transaction log. Never list employees or addresses; the server resolves the selectors",
+            "parameters": {
+                "type": "object",
+                "properties": dict(ROSTER_SELECTOR_PROPERTIES, rpc_url={"type": "string", "description": "Optional RPC URL for the Sonic node"})
+            }
+        },
+        {
+            "name": "complete_bulk_transfer",
+            "description": "Transfer Sonic to all the employees (or those matched by the optional selectors) to complete payroll",
+            "parameters": {"type": "object", "properties": ROSTER_SELECTOR_PROPERTIES}
+        },
+        {
+            "name": "plan_payroll",
+            "description": "Prepare the payroll ahead of payday: validate recipients, sign every transfer and return a plan id with totals for review",
+            "parameters": {
+                "type": "object",
+                "properties": dict(ROSTER_SELECTOR_PROPERTIES, rpc_url={"type": "string", "description": "Optional RPC URL for the Sonic node"})
+            }
+        },
+        {
+            "name": "execute_payroll_plan",
+            "description": "Broadcast a previously prepared payroll plan",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "rpc_url": {"type": "string", "description": "RPC URL for the Sonic node"},
-                    "employees_json": {"type": "string", "description": "JSON string of employees and salaries"}
+                    "plan_id": {"type": "string", "description": "The id returned by plan_payroll"}
                 },
-                "required": ["rpc_url", "employees_json"]
+                "required": ["plan_id"]
             }
         },
         {
-            "name": "complete_bulk_transfer",
-            "description": "Transfer Sonic to all the employees to complete payroll",
-            "parameters": {"type": "object", "properties": {}}
+            "name": "reconcile_transfer_log",
+            "description": "Audit the bulk transfer log against the blockchain: flag status/recipient/amount mismatches and missing transactions",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "rpc_url": {"type": "string", "description": "Optional RPC URL for the Sonic node"},
+                    "full": {"type": "boolean", "description": "Re-check every row instead of resuming from the last checkpoint"}
+                }
+            }
         },
         {
             "name": "transaction_insights",
@@ -979,8 +4398,11 @@ def process_and_execute_message(message):
     # Build messages list including system prompt and previous chat history
     messages = [system_prompt] + chat_history + [{"role": "user", "content": message}]
     
-    response = openai.ChatCompletion.create(
-        model="gpt-4o",
+    tier, reason = classify_turn(message, system_prompt)
+    response, route = routed_completion(
+        "process_and_execute_message",
+        tier=tier,
+        reason=reason,
         messages=messages,
         functions=functions,
         function_call="auto"
@@ -991,7 +4413,8 @@ def process_and_execute_message(message):
     result = {
         "ai_message": response_message.get("content", "I've processed your request."),
         "function_details": None,
-        "function_result": None
+        "function_result": None,
+        "routing": route
     }
     
     # If a function call was identified, process it
@@ -1000,6 +4423,7 @@ def process_and_execute_message(message):
         function_args_str = response_message["function_call"]["arguments"]
         
         print(f"Function called: {function_name}")
+        dispatch_started = time.perf_counter()
         
         try:
             function_args = json.loads(function_args_str)
@@ -1022,12 +4446,29 @@ def process_and_execute_message(message):
                     function_args.get("title"),
                     function_args.get("body")
                 )
+            elif function_name == "cross_post":
+                print("Executing: cross_post")
+                result["function_result"] = cross_post(
+                    function_args.get("body"),
+                    function_args.get("title"),
+                    function_args.get("twitter", True),
+                    function_args.get("subreddits")
+                )
             elif function_name == "generate_post":
                 print("Executing: generate_post")
                 result["function_result"] = generate_post(
                     function_args.get("platform"),
                     function_args.get("description")
                 )
+            elif function_name == "generate_campaign":
+                print("Executing: generate_campaign")
+                result["function_result"] = generate_campaign(function_args.get("jobs"))
+            elif function_name == "analyze_comment_sentiment":
+                print("Executing: analyze_comment_sentiment")
+                result["function_result"] = analyze_comment_sentiment(
+                    function_args.get("twitter_ids"),
+                    function_args.get("reddit_ids")
+                )
             elif function_name == "get_company_details":
                 print("Executing: get_company_details")
                 result["function_result"] = get_company_details()
@@ -1038,11 +4479,27 @@ def process_and_execute_message(message):
                 print("Executing: silent_bulk_transfer")
                 result["function_result"] = silent_bulk_transfer(
                     function_args.get("rpc_url"),
-                    function_args.get("employees_json")
+                    function_args.get("employees_json"),
+                    roster=roster_selectors(function_args)
                 )
             elif function_name == "complete_bulk_transfer":
                 print("Executing: complete_bulk_transfer")
-                result["function_result"] = complete_bulk_transfer()
+                result["function_result"] = complete_bulk_transfer(roster=roster_selectors(function_args))
+            elif function_name == "plan_payroll":
+                print("Executing: plan_payroll")
+                result["function_result"] = plan_payroll(
+                    function_args.get("rpc_url"),
+                    roster=roster_selectors(function_args)
+                )
+            elif function_name == "execute_payroll_plan":
+                print("Executing: execute_payroll_plan")
+                result["function_result"] = execute_payroll_plan(function_args.get("plan_id"))
+            elif function_name == "reconcile_transfer_log":
+                print("Executing: reconcile_transfer_log")
+                result["function_result"] = reconcile_transfer_log(
+                    rpc_url=function_args.get("rpc_url"),
+                    full=bool(function_args.get("full"))
+                )
             elif function_name == "transaction_insights":
                 print("Executing: transaction_insights")
                 result["function_result"] = transaction_insights(
@@ -1102,41 +4559,808 @@ def process_and_execute_message(message):
                 "status": "error",
                 "message": f"Error executing function: {str(e)}"
             }
+        finally:
+            record_stage("function_dispatch", time.perf_counter() - dispatch_started, tool=function_name)
+            function_result = result["function_result"]
+            status = function_result.get("status", "unknown") if isinstance(function_result, dict) else "unknown"
+            metrics.inc("payzoll_tool_calls_total", {"tool": function_name, "status": status})
     # If no function call was matched, use the plain GPT answer
     else:
         result["ai_message"] = response_message.get("content", "I've processed your request.")
     
     # Append the current conversation to chat history (user and assistant messages)
-    append_to_chat_history("user", message)
-    if "ai_message" in result and result["ai_message"]:
-        append_to_chat_history("assistant", result["ai_message"])
+    with stage_timer("history_save"):
+        append_to_chat_history("user", message)
+        if "ai_message" in result and result["ai_message"]:
+            append_to_chat_history("assistant", result["ai_message"])
+    end_prefetch()
     
     return result
 
+# ----------------------
+# Admission Control for /api
+# ----------------------
+# Requests are classified by intent before any model call: payroll and transfers are
+# high priority, analytics medium, everything else low. At most ADMISSION_MAX_ACTIVE
+# requests run at once; the rest wait in bounded per-priority queues and the highest
+# priority waiter goes next. Each client may only have a few requests in flight.
+# Full queues, busy clients and waits past the priority's deadline are answered
+# immediately with 429 and a Retry-After estimate. Limits are per server process.
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "8"))
+ADMISSION_CLIENT_CONCURRENCY = int(os.getenv("ADMISSION_CLIENT_CONCURRENCY", "2"))
+ADMISSION_PRIORITIES = ("high", "medium", "low")
+ADMISSION_QUEUE_LIMITS = {"high": 64, "medium": 32, "low": 16}
+ADMISSION_MAX_WAIT_SECONDS = {"high": 60.0, "medium": 30.0, "low": 10.0}
+# Reverse proxies (comma-separated addresses) whose X-Client-Id / X-Forwarded-For are
+# believed; from anyone else those headers are ignored so limits can't be dodged
+ADMISSION_TRUSTED_PROXIES = {addr.strip() for addr in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if addr.strip()}
+
+PRIORITY_PATTERNS = (
+    ("high", re.compile(r"\b(pay|paying|payroll|payout|transfer|salar(y|ies)|plan|execute|send|nonce|wallet)\b", re.IGNORECASE)),
+    ("medium", re.compile(r"\b(analytics?|insights?|report|reconcile|export|employees?|transactions?|sentiment|company)\b", re.IGNORECASE)),
+)
+
+def classify_priority(message):
+    """
+    Picks the admission priority of a message from its wording.
+    """
+    for priority, pattern in PRIORITY_PATTERNS:
+        if pattern.search(message):
+            return priority
+    return "low"
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Bounded per-priority queues in front of a fixed number of active slots, with
+    per-client concurrency limits.
+    """
+    def __init__(self, max_active, client_concurrency, queue_limits, max_wait):
+        self.max_active = max_active
+        self.client_concurrency = client_concurrency
+        self.queue_limits = queue_limits
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.queues = {priority: collections.deque() for priority in ADMISSION_PRIORITIES}
+        self.active = 0
+        self.per_client = collections.Counter()
+        # Moving average of how long an admitted request holds its slot
+        self.service_seconds = 2.0
+
+    def _retry_after(self, priority):
+        ahead = sum(len(self.queues[p]) for p in ADMISSION_PRIORITIES[:ADMISSION_PRIORITIES.index(priority) + 1])
+        return max(1, math.ceil(self.service_seconds * (ahead + 1) / self.max_active))
+
+    def _publish(self):
+        for priority, waiting in self.queues.items():
+            metrics.set_gauge("payzoll_admission_queue_depth", len(waiting), {"priority": priority})
+        metrics.set_gauge("payzoll_admission_active", self.active)
+
+    def _next_ticket(self):
+        for priority in ADMISSION_PRIORITIES:
+            if self.queues[priority]:
+                return self.queues[priority][0]
+        return None
+
+    def _reject(self, priority, reason):
+        metrics.inc("payzoll_admission_rejected_total", {"priority": priority, "reason": reason})
+        return AdmissionRejected(reason, self._retry_after(priority))
+
+    def _release_client(self, client_id):
+        self.per_client[client_id] -= 1
+        if not self.per_client[client_id]:
+            del self.per_client[client_id]
+
+    @contextmanager
+    def admit(self, client_id, priority):
+        """
+        Holds an active slot for the enclosed block, waiting in the priority's queue
+        if needed. Raises AdmissionRejected when the request can't be taken.
+        """
+        ticket = object()
+        enqueued = time.monotonic()
+        with self.lock:
+            if self.per_client[client_id] >= self.client_concurrency:
+                raise self._reject(priority, "client_concurrency")
+            waiting = self.queues[priority]
+            if len(waiting) >= self.queue_limits[priority]:
+                raise self._reject(priority, "queue_full")
+            self.per_client[client_id] += 1
+            waiting.append(ticket)
+            self._publish()
+            deadline = enqueued + self.max_wait[priority]
+            try:
+                while not (self.active < self.max_active and self._next_ticket() is ticket):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        waiting.remove(ticket)
+                        self.changed.notify_all()
+                        raise self._reject(priority, "timeout")
+                    self.changed.wait(remaining)
+            except BaseException:
+                self._release_client(client_id)
+                if ticket in waiting:
+                    waiting.remove(ticket)
+                self._publish()
+                raise
+            waiting.popleft()
+            self.active += 1
+            self._publish()
+        started = time.monotonic()
+        metrics.observe("payzoll_admission_wait_seconds", started - enqueued, {"priority": priority})
+        try:
+            yield started - enqueued
+        finally:
+            with self.lock:
+                self.active -= 1
+                self._release_client(client_id)
+                self.service_seconds = 0.9 * self.service_seconds + 0.1 * (time.monotonic() - started)
+                self._publish()
+                self.changed.notify_all()
+
+admission = AdmissionController(ADMISSION_MAX_ACTIVE, ADMISSION_CLIENT_CONCURRENCY, ADMISSION_QUEUE_LIMITS, ADMISSION_MAX_WAIT_SECONDS)
+metrics.describe("payzoll_admission_queue_depth", "gauge", "Requests waiting for an /api slot by priority")
+metrics.describe("payzoll_admission_active", "gauge", "Requests currently holding an /api slot")
+metrics.describe("payzoll_admission_wait_seconds", "histogram", "Time requests waited in the admission queue by priority")
+metrics.describe("payzoll_admission_rejected_total", "counter", "Requests answered with 429 by priority and reason")
+
+def usage_identity(req, data, client_id):
+    """
+    Returns the (tenant, session) usage and budgets are charged to. Only a trusted
+    proxy may name them; anyone else could dodge a budget by changing the header.
+    """
+    if (req.remote_addr or "unknown") not in ADMISSION_TRUSTED_PROXIES:
+        return client_id, client_id
+    tenant = req.headers.get("X-Tenant-Id") or "default"
+    session = req.headers.get("X-Session-Id") or data.get("session_id") or client_id
+    return tenant, session
+
+def client_id_for(req):
+    """
+    Identifies the caller for per-client limits: the remote address, or behind a
+    trusted proxy its X-Client-Id / first X-Forwarded-For address.
+    """
+    remote = req.remote_addr or "unknown"
+    if remote not in ADMISSION_TRUSTED_PROXIES:
+        return remote
+    return req.headers.get("X-Client-Id") or req.headers.get("X-Forwarded-For", "").split(",")[0].strip() or remote
+
+# ----------------------
+# Request Profiling
+# ----------------------
+# A request sent with "X-Profile: 1", or picked at PROFILE_SAMPLE_RATE, is profiled
+# by a sampling profiler: a background thread snapshots the request thread's stack
+# (plus pipeline, lane and prefetch worker threads) every PROFILE_INTERVAL_MS. The
+# samples are saved as collapsed stacks (flamegraph.pl / speedscope input) under
+# data/profiles/<request id>.collapsed with a small JSON summary next to them.
+# Worker threads of other requests running at the same time can show up too.
+# Profiling costs CPU and disk, so the header is off unless PROFILE_HEADER_ENABLED
+# is set, and with PROFILE_TOKEN it must carry that token instead of "1". Profiles
+# expose code paths and timings, so with PROFILE_TOKEN the /api/profiles endpoints
+# also require it (X-Profile-Token header).
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER_ENABLED = os.getenv("PROFILE_HEADER_ENABLED", "off").lower() in ("on", "1", "true")
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+PROFILE_WORKER_PREFIXES = ("pipeline", "lane", "prefetch")
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+metrics.describe("payzoll_profiles_total", "counter", "Requests profiled, by trigger")
+
+class StackSampler:
+    """
+    Samples the stacks of one thread and the worker threads it uses into collapsed
+    stack counts.
+    """
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self.thread_id:
+                root = "request"
+            elif names.get(ident, "").startswith(PROFILE_WORKER_PREFIXES):
+                root = names[ident].rstrip("0123456789_-")
+            else:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if root != "request" and stack[0] == "thread.py:_worker":
+                # Idle pool worker waiting for a task
+                continue
+            stack.append(root)
+            self.counts[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+def profile_token_ok(value):
+    """
+    True if value is PROFILE_TOKEN, or no token is configured.
+    """
+    return not PROFILE_TOKEN or hmac.compare_digest(value.encode("utf-8"), PROFILE_TOKEN.encode("utf-8"))
+
+def profile_trigger(req):
+    """
+    Returns why this request should be profiled ("header" or "sampled"), or None.
+    """
+    header = req.headers.get("X-Profile", "")
+    if PROFILE_HEADER_ENABLED and (profile_token_ok(header) if PROFILE_TOKEN else header.lower() in ("1", "true", "yes")):
+        return "header"
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+def _profile_paths(request_id):
+    if not REQUEST_ID_PATTERN.fullmatch(request_id or ""):
+        raise ValueError(f"Invalid request id: {request_id}")
+    base = os.path.join(PROFILE_DIR, request_id)
+    return f"{base}.collapsed", f"{base}.json"
+
+def _claim_profile_id(request_id):
+    """
+    Reserves a profile id for the request: the request id, or if a profile already
+    has that id (request ids can be chosen by the client) the id with a suffix.
+    Returns (profile id, summary file opened for writing).
+    """
+    profile_id = request_id
+    while True:
+        try:
+            return profile_id, open(_profile_paths(profile_id)[1], "x")
+        except FileExistsError:
+            profile_id = f"{request_id[:55]}-{uuid.uuid4().hex[:8]}"
+
+def save_profile(request_id, sampler, summary):
+    """
+    Writes the collapsed stacks and summary of a profiled request and prunes the
+    oldest profiles beyond PROFILE_KEEP. Returns the profile id.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id, summary_file = _claim_profile_id(request_id)
+    stacks_path, _ = _profile_paths(profile_id)
+    with open(stacks_path, "w") as f:
+        f.write(sampler.collapsed())
+    with summary_file:
+        json.dump(dict(summary, request_id=request_id, profile_id=profile_id, samples=sampler.samples,
+                       interval_ms=PROFILE_INTERVAL_MS, stacks=len(sampler.counts)), summary_file)
+
+    summaries = sorted((entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".json")),
+                       key=lambda entry: entry.stat().st_mtime)
+    for entry in summaries[:max(0, len(summaries) - PROFILE_KEEP)]:
+        for path in _profile_paths(entry.name[:-len(".json")]):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return profile_id
+
+def list_profiles(limit=50):
+    """
+    Summaries of the most recent profiles, newest first.
+    """
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    summaries = sorted((entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".json")),
+                       key=lambda entry: entry.stat().st_mtime, reverse=True)
+    profiles = []
+    for entry in summaries[:limit]:
+        try:
+            with open(entry.path, "r") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+def profiled(view):
+    """
+    Wraps an endpoint so requests picked by profile_trigger run under the sampler.
+    The response carries X-Request-Id, and X-Profile-Id when a profile was saved.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        request_id = request.headers.get("X-Request-Id", "")
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        trigger = profile_trigger(request)
+        if trigger is None:
+            response = app.make_response(view(*args, **kwargs))
+            response.headers["X-Request-Id"] = request_id
+            return response
+
+        metrics.inc("payzoll_profiles_total", {"trigger": trigger})
+        started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        started = time.perf_counter()
+        sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000).start()
+        status = 500
+        profile_id = None
+        try:
+            response = app.make_response(view(*args, **kwargs))
+            status = response.status_code
+        finally:
+            sampler.stop()
+            try:
+                profile_id = save_profile(request_id, sampler, {
+                    "path": request.path,
+                    "trigger": trigger,
+                    "started_at": started_at,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                    "status_code": status
+                })
+            except Exception as e:
+                print(f"Could not save profile {request_id}: {e}")
+        response.headers["X-Request-Id"] = request_id
+        if profile_id:
+            response.headers["X-Profile-Id"] = profile_id
+        return response
+    return wrapper
+
 # ----------------------
 # Single Unified Endpoint
 # ----------------------
 @app.route("/api", methods=["POST"])
+@profiled
 def unified_api():
     """
     Single endpoint that handles all requests by analyzing the message content.
-    Expects JSON: { "message": "<user message>" }
+    Expects JSON: { "message": "<user message>", "timings": <optional bool>, "session_id": <optional> }
+    With "timings": true (or ?timings=1) the response includes per-stage timings in ms.
+    Token usage is attributed to the X-Tenant-Id and X-Session-Id headers when they
+    come through a trusted proxy, otherwise to the client.
     """
     data = request.json
     message = data.get("message", "")
     print(f"Received request at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: {data}")
     
     if not message:
+        metrics.inc("payzoll_api_requests_total", {"status": "rejected"})
         return jsonify({
             "status": "error",
             "message": "No message provided in the request"
         })
     
-    result = process_and_execute_message(message)
+    priority = classify_priority(message)
+    client_id = client_id_for(request)
+    tenant, session = usage_identity(request, data, client_id)
+    request_usage = {"prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+    _request_state.timings = {}
+    started = time.perf_counter()
+    try:
+        with admission.admit(client_id, priority) as waited:
+            _request_state.timings["admission_wait"] = waited * 1000
+            budget = usage_ledger.budget_level(tenant, session)
+            _request_state.usage_context = {"tenant": tenant, "session": session, "budget": budget, "request": request_usage}
+            result = process_and_execute_message(message)
+            result["usage"] = request_usage
+            if budget != "ok":
+                result["budget"] = budget
+        elapsed = time.perf_counter() - started
+        metrics.observe("payzoll_stage_duration_seconds", elapsed, stage_labels("total"))
+        metrics.inc("payzoll_api_requests_total", {"status": "handled"})
+        if data.get("timings") or request.args.get("timings"):
+            timings = {stage: round(ms, 3) for stage, ms in _request_state.timings.items()}
+            timings["total"] = round(elapsed * 1000, 3)
+            result["timings"] = timings
+    except AdmissionRejected as e:
+        metrics.inc("payzoll_api_requests_total", {"status": "throttled"})
+        response = jsonify({
+            "status": "error",
+            "message": f"Server busy ({e.reason}), retry in {e.retry_after}s",
+            "priority": priority
+        })
+        return response, 429, {"Retry-After": str(e.retry_after)}
+    finally:
+        end_prefetch()
+        _request_state.timings = None
+        _request_state.usage_context = None
     return jsonify(result)
 
+# ----------------------
+# Static Content Endpoints
+# ----------------------
+# The features, FAQ, guides, comparison and case studies never change while the
+# server runs, so their JSON (plain and gzipped) is serialized once at startup and
+# served with a strong ETag. Clients and CDNs revalidate with If-None-Match and get a
+# 304 without the model, or even the serializer, being involved.
+CONTENT_MAX_AGE = int(os.getenv("CONTENT_MAX_AGE", "3600"))
+STATIC_CONTENT = {
+    "features": get_payzoll_features,
+    "faq": get_payzoll_faq,
+    "web3-payroll-guide": get_web3_payroll_guide,
+    "payroll-comparison": compare_payroll_systems,
+    "case-studies": get_case_studies,
+    "implementation-guide": get_implementation_guide,
+}
+
+def _build_content_body(payload):
+    """
+    Serializes a payload once into plain and gzip variants, each with its own strong ETag.
+    """
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    return {
+        "identity": (body, f'"{digest}"'),
+        "gzip": (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gz"'),
+    }
+
+def build_static_content():
+    bodies = {name: _build_content_body(fn()) for name, fn in STATIC_CONTENT.items()}
+    bodies[""] = _build_content_body({"status": "success", "data": sorted(STATIC_CONTENT)})
+    return bodies
+
+_static_content_bodies = build_static_content()
+metrics.describe("payzoll_content_requests_total", "counter", "Requests for static content by name and response status")
+
+@app.route("/api/content", methods=["GET"], defaults={"name": ""})
+@app.route("/api/content/<name>", methods=["GET"])
+def static_content(name):
+    """
+    Serves precomputed static content with ETag/Cache-Control; 304 on a matching If-None-Match.
+    """
+    variants = _static_content_bodies.get(name)
+    if variants is None:
+        metrics.inc("payzoll_content_requests_total", {"name": "unknown", "status": "404"})
+        return jsonify({"status": "error", "message": f"Unknown content: {name}"}), 404
+
+    encoding = "gzip" if request.accept_encodings["gzip"] else "identity"
+    body, etag = variants[encoding]
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CONTENT_MAX_AGE}, stale-while-revalidate={CONTENT_MAX_AGE}",
+        "Vary": "Accept-Encoding",
+    }
+    if request.if_none_match.contains(etag.strip('"')):
+        metrics.inc("payzoll_content_requests_total", {"name": name or "index", "status": "304"})
+        return "", 304, headers
+
+    headers["Content-Type"] = "application/json"
+    if encoding == "gzip":
+        headers["Content-Encoding"] = "gzip"
+    metrics.inc("payzoll_content_requests_total", {"name": name or "index", "status": "200"})
+    return body, 200, headers
+
+# ----------------------
+# Payroll Plan Endpoint
+# ----------------------
+@app.route("/api/payroll-plans/<plan_id>", methods=["GET"])
+def payroll_plan_status(plan_id):
+    """
+    Returns a payroll plan's totals and status for review before execution.
+    """
+    try:
+        return jsonify({"status": "success", "data": load_payroll_plan(plan_id)})
+    except (FileNotFoundError, ValueError):
+        return jsonify({"status": "error", "message": f"Unknown payroll plan: {plan_id}"}), 404
+
+# ----------------------
+# Transaction History Export
+# ----------------------
+# Streams the transfer log as CSV or NDJSON straight from disk, a chunk of rows at a
+# time, so memory stays flat and the first bytes go out immediately. Every row
+# carries a cursor (byte offset of the next row); pass the last one back as ?cursor=
+# to continue after a page of ?limit= rows.
+EXPORT_CHUNK_ROWS = 500
+EXPORT_STATUS_ALIASES = {"success": "1", "succeeded": "1", "failed": "0"}
+EXPORT_FIELDS = TRANSFER_LOG_FIELDS + ["cursor"]
+
+def _export_params(args):
+    """
+    Validates the export query parameters. Raises ValueError with a message for the client.
+    """
+    fmt = args.get("format", "csv").lower()
+    if fmt not in ("csv", "ndjson"):
+        raise ValueError("format must be csv or ndjson")
+    date_from, date_to = args.get("from"), args.get("to")
+    for value in (date_from, date_to):
+        if value and not re.fullmatch(r"\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2})?", value):
+            raise ValueError("from/to must be YYYY-MM-DD or YYYY-MM-DD HH:MM:SS")
+    status = args.get("status")
+    limit = args.get("limit")
+    if limit is not None and (not limit.isdigit() or int(limit) < 1):
+        raise ValueError("limit must be a positive integer")
+    cursor = args.get("cursor") or "0"
+    if not cursor.isdigit():
+        raise ValueError("invalid cursor")
+    return {
+        "format": fmt,
+        "date_from": date_from,
+        "date_to": date_to,
+        "recipient": (args.get("recipient") or "").lower() or None,
+        "status": EXPORT_STATUS_ALIASES.get((status or "").lower(), status),
+        "limit": int(limit) if limit else None,
+        "cursor": int(cursor),
+    }
+
+def _check_export_cursor(log_csv_path, cursor):
+    """
+    A cursor must point at the start of a row: 0 or just past a newline.
+    """
+    if cursor == 0:
+        return True
+    if cursor > os.path.getsize(log_csv_path):
+        return False
+    with open(log_csv_path, mode='rb') as file:
+        file.seek(cursor - 1)
+        return file.read(1) == b"\n"
+
+def _export_matches(row, params):
+    timestamp = row.get("timestamp") or ""
+    if params["date_from"] and timestamp[:len(params["date_from"])] < params["date_from"]:
+        return False
+    if params["date_to"] and timestamp[:len(params["date_to"])] > params["date_to"]:
+        return False
+    if params["recipient"] and (row.get("recipient") or "").lower() != params["recipient"]:
+        return False
+    if params["status"] and row.get("status") != params["status"]:
+        return False
+    return True
+
+def export_transfer_rows(log_csv_path, params):
+    """
+    Yields the export body in chunks: matching rows from the cursor on, up to the limit.
+    """
+    buffer = io.StringIO()
+    if params["format"] == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        write = lambda record: buffer.write(json.dumps(record) + "\n")
+    # Send the header (or nothing, for NDJSON) right away
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    emitted = 0
+    pending = 0
+    for end_offset, row in _iter_log_rows(log_csv_path, params["cursor"]):
+        if not _export_matches(row, params):
+            continue
+        record = {field: row.get(field, "") for field in TRANSFER_LOG_FIELDS}
+        record["cursor"] = str(end_offset)
+        write(record)
+        emitted += 1
+        pending += 1
+        if pending >= EXPORT_CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+        if params["limit"] and emitted >= params["limit"]:
+            break
+    if pending:
+        yield buffer.getvalue()
+    metrics.inc("payzoll_export_rows_total", {"format": params["format"]}, emitted)
+
+metrics.describe("payzoll_export_rows_total", "counter", "Transfer log rows streamed by the export endpoint")
+
+@app.route("/api/transfers/export", methods=["GET"])
+def export_transfers():
+    """
+    Streams the transfer log as CSV or NDJSON.
+    Query: format=csv|ndjson, from, to (YYYY-MM-DD[ HH:MM:SS]), recipient, status
+    (1/success, 0/failed, stuck), limit, cursor (from the last row of the previous page).
+    """
+    try:
+        params = _export_params(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    log_csv_path = os.path.join(DATA_DIR, DEFAULT_TRANSACTION_LOG)
+    if not os.path.exists(log_csv_path):
+        return jsonify({"status": "error", "message": "No transaction log yet"}), 404
+    if not _check_export_cursor(log_csv_path, params["cursor"]):
+        return jsonify({"status": "error", "message": "invalid cursor"}), 400
+
+    if params["format"] == "csv":
+        mimetype = "text/csv"
+        headers = {"Content-Disposition": "attachment; filename=transfers.csv"}
+    else:
+        mimetype = "application/x-ndjson"
+        headers = {}
+    headers["X-Accel-Buffering"] = "no"
+    headers["Cache-Control"] = "no-store"
+    body = stream_with_context(export_transfer_rows(log_csv_path, params))
+    return Response(body, mimetype=mimetype, headers=headers)
+
+# ----------------------
+# Usage Report Endpoint
+# ----------------------
+@app.route("/api/usage", methods=["GET"])
+def usage_report():
+    """
+    Reports prompt/completion tokens and estimated spend.
+    Query: group_by=tool|model|tenant|session, hours (default 24), tenant.
+    """
+    group_by = request.args.get("group_by", "tool")
+    if group_by not in USAGE_GROUPS:
+        return jsonify({"status": "error", "message": f"group_by must be one of {', '.join(USAGE_GROUPS)}"}), 400
+    try:
+        hours = int(request.args.get("hours", "24"))
+    except ValueError:
+        return jsonify({"status": "error", "message": "hours must be an integer"}), 400
+    report = usage_ledger.report(group_by, max(1, hours), request.args.get("tenant"))
+    return jsonify({"status": "success", "data": report})
+
+# ----------------------
+# Metrics Endpoint
+# ----------------------
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """
+    Exposes stage histograms and per-tool/model/RPC-method counters for Prometheus.
+    """
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+# ----------------------
+# Outbox Status Endpoint
+# ----------------------
+@app.route("/api/outbox/<outbox_id>", methods=["GET"])
+def outbox_status(outbox_id):
+    """
+    Returns the delivery state of a queued cross-post.
+    """
+    entry = posting_engine.get(outbox_id)
+    if entry is None:
+        return jsonify({"status": "error", "message": f"Unknown outbox id: {outbox_id}"}), 404
+    return jsonify({"status": "success", "data": entry})
+
+# ----------------------
+# Profile Endpoints
+# ----------------------
+@app.route("/api/profiles", methods=["GET"])
+def profiles_index():
+    """
+    Lists recent request profiles, newest first. Query: limit (default 50).
+    """
+    if not profile_token_ok(request.headers.get("X-Profile-Token", "")):
+        return jsonify({"status": "error", "message": "Missing or invalid X-Profile-Token"}), 403
+    try:
+        limit = int(request.args.get("limit", "50"))
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit must be an integer"}), 400
+    return jsonify({"status": "success", "data": list_profiles(max(1, limit))})
+
+@app.route("/api/profiles/<profile_id>", methods=["GET"])
+def profile_download(profile_id):
+    """
+    Downloads the collapsed stacks of one profiled request (by its X-Profile-Id).
+    """
+    if not profile_token_ok(request.headers.get("X-Profile-Token", "")):
+        return jsonify({"status": "error", "message": "Missing or invalid X-Profile-Token"}), 403
+    try:
+        stacks_path, _ = _profile_paths(profile_id)
+        with open(stacks_path, "r") as f:
+            body = f.read()
+    except (ValueError, FileNotFoundError):
+        return jsonify({"status": "error", "message": f"Unknown profile: {profile_id}"}), 404
+    return Response(body, mimetype="text/plain", headers={
+        "Content-Disposition": f"attachment; filename={profile_id}.collapsed"
+    })
+
+# ----------------------
+# Startup Time Report
+# ----------------------
+DEFERRED_IMPORTS = ("web3", "tweepy", "praw")
+
+def startup_time_report(module="web_agent_4o"):
+    """
+    Imports the module in a fresh interpreter with -X importtime and returns the
+    cumulative cost of each of its direct imports, slowest first.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        return {"status": "error", "message": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed"}
+
+    imported = set()
+    children = []
+    imports = []
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)", line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = int(match.group(1)), int(match.group(2)), match.group(3), match.group(4)
+        imported.add(name.split(".")[0])
+        depth = len(indent) // 2
+        if depth == 1:
+            children.append({"module": name, "self_ms": self_us / 1000, "cumulative_ms": cumulative_us / 1000})
+        elif depth == 0:
+            if name == module:
+                imports, total_us = children, cumulative_us
+            children = []
+
+    return {"status": "success", "data": {
+        "module": module,
+        "total_ms": total_us / 1000,
+        "imports": sorted(imports, key=lambda entry: entry["cumulative_ms"], reverse=True),
+        "deferred": {name: name not in imported for name in DEFERRED_IMPORTS}
+    }}
+
+def print_startup_report(top=15):
+    report = startup_time_report()
+    if report["status"] != "success":
+        print(f"Startup report failed: {report['message']}")
+        return 1
+    data = report["data"]
+    print(f"Importing {data['module']} took {data['total_ms']:.1f} ms")
+    print(f"{'cumulative ms':>14}  {'self ms':>9}  module")
+    for entry in data["imports"][:top]:
+        print(f"{entry['cumulative_ms']:>14.1f}  {entry['self_ms']:>9.1f}  {entry['module']}")
+    for name, deferred in data["deferred"].items():
+        print(f"{name}: {'deferred until first use' if deferred else 'IMPORTED AT STARTUP'}")
+    return 0
+
 # ----------------------
 # Main entry point
 # ----------------------
-if __name__ == "__main__":
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PayZoll agent server")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("serve", help="Run the development server (default)")
+    report_parser = subparsers.add_parser("startup-report", help="Show an -X importtime breakdown of server boot")
+    report_parser.add_argument("--top", type=int, default=15, help="Number of imports to list")
+    reconcile_parser = subparsers.add_parser("reconcile", help="Verify the transfer log against the chain")
+    reconcile_parser.add_argument("--log", default=None, help=f"Log file under {DATA_DIR}/ (default {DEFAULT_TRANSACTION_LOG})")
+    reconcile_parser.add_argument("--rpc-url", default=None, help="RPC URL (default SONIC_RPC_URL)")
+    reconcile_parser.add_argument("--full", action="store_true", help="Ignore the checkpoint and re-check every row")
+    import_parser = subparsers.add_parser("import-cassette", help="Convert bot transcripts into a seed cassette")
+    import_parser.add_argument("transcripts", nargs="+", help="Transcript files, e.g. All_Companies/PayZoll/*.json")
+    import_parser.add_argument("--output", default=os.path.join(CASSETTE_DIR, "seed.json"), help="Cassette file to write")
+    replay_parser = subparsers.add_parser("replay-run", help="Replay a cassette's conversation offline and time it")
+    replay_parser.add_argument("cassette", help="Cassette file")
+    replay_parser.add_argument("--latency-ms", default="", help='Delay per replayed call in ms, or "recorded"')
+    replay_parser.add_argument("--repeat", type=int, default=1, help="Times to replay the conversation")
+    args = parser.parse_args(argv)
+
+    if args.command == "import-cassette":
+        print(json.dumps(import_transcript_cassette(args.transcripts, args.output), indent=2))
+        return 0
+    if args.command == "replay-run":
+        result = replay_cassette_run(args.cassette, args.latency_ms, args.repeat)
+        print(json.dumps(result, indent=2))
+        return 0 if result["status"] == "success" else 1
+    if args.command == "startup-report":
+        return print_startup_report(args.top)
+    if args.command == "reconcile":
+        result = reconcile_transfer_log(args.log, args.rpc_url, args.full)
+        print(json.dumps(result, indent=2))
+        return 0 if result["status"] == "success" else 1
     app.run(debug=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())